@@ -2,6 +2,8 @@
 import sqlite3
 import functools
 
+from cache_engine import database_of, track_tables, invalidation_bus
+
 # Decorator to handle database connection
 def with_db_connection(func):
     @functools.wraps(func)
@@ -16,17 +18,21 @@ def with_db_connection(func):
 
 
 # Decorator to manage transactions (commit or rollback)
+# After a commit it publishes the tables the transaction wrote on the
+# invalidation bus, so cached reads of those tables are dropped
 def transactional(func):
     @functools.wraps(func)
     def wrapper(conn, *args, **kwargs):
         try:
-            result = func(conn, *args, **kwargs)
+            with track_tables(conn) as access:
+                result = func(conn, *args, **kwargs)
             conn.commit()  # commit changes if successful
-            return result
         except Exception as e:
             conn.rollback()  # rollback on error
             print(f"Transaction failed: {e}")
             raise
+        invalidation_bus.publish(database_of(conn), access.written)
+        return result
     return wrapper
 
 
@@ -38,5 +44,6 @@ def update_user_email(conn, user_id, new_email):
     print("User email updated successfully.")
 
 
-# Example usage
-update_user_email(user_id=1, new_email='Crawford_Cartwright@hotmail.com')
+if __name__ == "__main__":
+    # Example usage
+    update_user_email(user_id=1, new_email='Crawford_Cartwright@hotmail.com')
@@ -1,9 +1,49 @@
 
+import os
 import time
 import sqlite3
 import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-query_cache = {}
+from cache_engine import (QueryCache, MISS, database_of, make_key,
+                          track_tables, invalidation_bus, SingleFlight,
+                          AsyncSingleFlight, adatabase_of, atrack_tables,
+                          SQLiteCacheStore, TieredCache)
+
+# Results are kept per (database, query, parameters), evicted least recently
+# used first once they take more than max_bytes, and expire after ttl seconds.
+# Writes committed through transactional drop the results read from the
+# tables they touched.
+# With QUERY_CACHE_PATH set, the in-process cache becomes the L1 tier in
+# front of a SQLite file shared by every worker process on the host.
+query_cache = None
+
+
+# Swap the cache behind cache_query, e.g. for a TieredCache or a store
+def use_cache(cache):
+    global query_cache
+    if query_cache is not None:
+        invalidation_bus.unsubscribe(query_cache.invalidate)
+    query_cache = cache
+    invalidation_bus.subscribe(cache.invalidate)
+    return cache
+
+
+def default_cache():
+    local = QueryCache(max_bytes=16 * 1024 * 1024, ttl=300)
+    shared_path = os.getenv("QUERY_CACHE_PATH")
+    if not shared_path:
+        return local
+    return TieredCache(local, SQLiteCacheStore(shared_path, ttl=300))
+
+
+use_cache(default_cache())
+
+# Concurrent misses on the same key run the query once; the other callers
+# wait for that result instead of all hitting the database (cache stampede)
+query_flights = SingleFlight()
+async_query_flights = AsyncSingleFlight()
 
 # Database connection decorator
 def with_db_connection(func):
@@ -18,22 +58,124 @@ def with_db_connection(func):
     return wrapper
 
 
+# Background workers for stale-while-revalidate refreshes, and the keys
+# they are currently refreshing
+refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+refreshing = set()
+refreshing_lock = threading.Lock()
+
+
+def _load(func, conn, key, database, args, kwargs, max_stale=0):
+    # Run the query and cache its result; called inside a single flight
+    # A flight that finished just before this one may have filled it. A
+    # stale entry within max_stale is left in place so other callers keep
+    # being served from it while this reload runs.
+    result, fresh = query_cache.lookup(key, max_stale, record=False)
+    if fresh:
+        return result
+    print("Executing query and caching result...")
+    version = query_cache.version
+    with track_tables(conn) as access:
+        result = func(conn, *args, **kwargs)
+    # Store result in cache along with the tables it was read from; a read
+    # that recorded no table is stored untracked, so any write drops it
+    query_cache.set(key, result, database=database,
+                    tables=access.read or None, since=version)
+    return result
+
+
+def _refresh(func, connect, key, database, args, kwargs, max_stale):
+    # Background worker body: reload one stale entry over its own connection
+    try:
+        conn = connect(database)
+        try:
+            query_flights.do(key, lambda: _load(func, conn, key, database,
+                                                args, kwargs, max_stale))
+        finally:
+            conn.close()
+    except Exception as e:
+        # The stale value keeps being served until it is too old
+        print(f"Background refresh failed: {e}")
+    finally:
+        with refreshing_lock:
+            refreshing.discard(key)
+
+
 # Caching decorator
-def cache_query(func):
+# @cache_query blocks on a miss or an expired entry.
+# @cache_query(stale_while_revalidate=N) returns an entry that expired less
+# than N seconds ago right away and reloads it on refresh_pool, over a new
+# connection from connect(database) (the caller's connection is closed by
+# then); entries older than that are reloaded in the caller as usual.
+def cache_query(func=None, *, stale_while_revalidate=0, connect=sqlite3.connect):
+    if func is None:
+        return functools.partial(cache_query,
+                                 stale_while_revalidate=stale_while_revalidate,
+                                 connect=connect)
+    # Same-named functions in different modules must not share entries
+    name = f"{func.__module__}.{func.__qualname__}"
+
     @functools.wraps(func)
     def wrapper(conn, *args, **kwargs):
-        # Determine query from args or kwargs
-        query = kwargs.get("query") or (args[0] if args else None)
-        
+        # Key on the database plus every argument: the query text and any
+        # bound parameters passed with it
+        database = database_of(conn)
+        key = make_key(database, name, args, kwargs)
+
         # Check if query exists in cache
-        if query in query_cache:
+        result, fresh = query_cache.lookup(key, stale_while_revalidate)
+        if result is not MISS:
+            if fresh:
+                print("Using cached result for query.")
+                return result
+            print("Using stale cached result and refreshing it in the background.")
+            # An in-memory database can't be reopened by a refresh worker
+            if database != ":memory:":
+                with refreshing_lock:
+                    start = key not in refreshing
+                    refreshing.add(key)
+                if start:
+                    try:
+                        refresh_pool.submit(_refresh, func, connect, key,
+                                            database, args, kwargs,
+                                            stale_while_revalidate)
+                    except RuntimeError:  # pool shut down at exit
+                        with refreshing_lock:
+                            refreshing.discard(key)
+            return result
+
+        return query_flights.do(
+            key, lambda: _load(func, conn, key, database, args, kwargs))
+    return wrapper
+
+
+# Caching decorator for coroutines taking an aiosqlite connection
+def async_cache_query(func):
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    async def wrapper(conn, *args, **kwargs):
+        database = await adatabase_of(conn)
+        key = make_key(database, name, args, kwargs)
+
+        result = query_cache.get(key)
+        if result is not MISS:
             print("Using cached result for query.")
-            return query_cache[query]
+            return result
 
-        print("Executing query and caching result...")
-        result = func(conn, *args, **kwargs)
-        query_cache[query] = result  # Store result in cache
-        return result
+        async def load():
+            result = query_cache.get(key, record=False)
+            if result is not MISS:
+                return result
+            print("Executing query and caching result...")
+            version = query_cache.version
+            async with atrack_tables(conn) as access:
+                result = await func(conn, *args, **kwargs)
+            query_cache.set(key, result, database=database,
+                            tables=access.read or None, since=version)
+            return result
+
+        return await async_query_flights.do(key, load)
     return wrapper
 
 
@@ -45,8 +187,20 @@ def fetch_users_with_cache(conn, query):
     return cursor.fetchall()
 
 
-# First call → runs query and caches it
-users = fetch_users_with_cache(query="SELECT * FROM users")
+# Dashboard variant: a result up to a minute past its ttl is fine, a
+# blocking refresh is not
+@with_db_connection
+@cache_query(stale_while_revalidate=60)
+def fetch_users_for_dashboard(conn, query):
+    cursor = conn.cursor()
+    cursor.execute(query)
+    return cursor.fetchall()
+
+
+if __name__ == "__main__":
+    # First call → runs query and caches it
+    users = fetch_users_with_cache(query="SELECT * FROM users")
 
-# Second call → fetches result from cache
-users_again = fetch_users_with_cache(query="SELECT * FROM users")
+    # Second call → fetches result from cache
+    users_again = fetch_users_with_cache(query="SELECT * FROM users")
+    print(query_cache.stats())
@@ -0,0 +1,119 @@
+
+import io
+import os
+import sys
+import time
+import timeit
+import sqlite3
+import tempfile
+import importlib
+import contextlib
+
+from cache_engine import (QueryCache, MISS, database_of, make_key,
+                          SQLiteCacheStore, TieredCache)
+
+# Measures the per-lookup overhead of QueryCache against the plain dict that
+# 4-cache_query.py used before, for hits, misses and full key construction,
+# then the call latency of cache_query while entries keep expiring, blocking
+# vs stale_while_revalidate.
+# Usage: python3 cache_benchmark.py [entries] [lookups]
+
+
+def run(entries=10000, lookups=200000):
+    rows = [(i, f"User {i}", f"user{i}@example.com") for i in range(10)]
+    keys = [make_key("my_database.db", "fetch_users_with_cache",
+                     ("SELECT * FROM users WHERE id = ?", (i,)))
+            for i in range(entries)]
+    plain = {key: rows for key in keys}
+    cache = QueryCache(max_bytes=1 << 30, ttl=300)
+    for key in keys:
+        cache.set(key, rows)
+    missing = make_key("my_database.db", "fetch_users_with_cache", ("nope",))
+    conn = sqlite3.connect(":memory:")
+    hot = keys[entries // 2]
+    tmp = tempfile.TemporaryDirectory()
+    store = SQLiteCacheStore(os.path.join(tmp.name, "cache.db"))
+    store.set(hot, rows, tables=())
+    tiered = TieredCache(QueryCache(), store)
+    tiered.get(hot)  # warm L1 from the shared store
+
+    cases = {
+        "dict hit": lambda: plain.get(hot),
+        "QueryCache hit": lambda: cache.get(hot),
+        "QueryCache miss": lambda: cache.get(missing) is MISS,
+        "make_key": lambda: make_key("my_database.db", "fetch_users_with_cache",
+                                     ("SELECT * FROM users WHERE id = ?", (7,))),
+        "database_of": lambda: database_of(conn),
+        "shared store hit": lambda: store.get(hot),
+        "tiered L1 hit": lambda: tiered.get(hot),
+    }
+    results = {}
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=lookups, repeat=5))
+        results[name] = seconds / lookups * 1e9
+        print(f"{name:<16} {results[name]:8.0f} ns/op")
+    conn.close()
+    tmp.cleanup()
+    return results
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def expiry_latency(calls=500, ttl=0.05, query_seconds=0.02, pause=0.002):
+    # Call a cached query whose entry expires every `ttl` seconds and whose
+    # execution takes `query_seconds`, and report p50/p99/max call latency
+    cache_query_module = importlib.import_module("4-cache_query")
+    cache = cache_query_module.query_cache
+
+    def slow_query(conn, query):
+        time.sleep(query_seconds)
+        return conn.execute(query).fetchall()
+    slow_query.__qualname__ = "slow_query"
+
+    modes = {
+        "blocking": cache_query_module.cache_query(slow_query),
+        "stale_while_revalidate": cache_query_module.cache_query(
+            stale_while_revalidate=60)(slow_query),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "users.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE users (id INTEGER, email TEXT)")
+        conn.commit()
+        conn.close()
+        default_ttl = cache.ttl
+        cache.ttl = ttl
+        try:
+            # cache_query prints on every call, also from refresh workers
+            with contextlib.redirect_stdout(io.StringIO()):
+                for name, fetch in modes.items():
+                    cache.clear()
+                    samples = []
+                    for _ in range(calls):
+                        conn = sqlite3.connect(path)
+                        start = time.perf_counter()
+                        fetch(conn, "SELECT * FROM users")
+                        samples.append(time.perf_counter() - start)
+                        conn.close()
+                        time.sleep(pause)
+                    results[name] = {
+                        "p50_ms": percentile(samples, 50) * 1e3,
+                        "p99_ms": percentile(samples, 99) * 1e3,
+                        "max_ms": max(samples) * 1e3,
+                    }
+                cache_query_module.refresh_pool.submit(lambda: None).result()
+        finally:
+            cache.ttl = default_ttl
+    for name, result in results.items():
+        print(f"{name:<24} p50 {result['p50_ms']:7.3f}ms  "
+              f"p99 {result['p99_ms']:7.3f}ms  max {result['max_ms']:7.3f}ms")
+    return results
+
+
+if __name__ == "__main__":
+    run(*(int(arg) for arg in sys.argv[1:]))
+    expiry_latency()
@@ -0,0 +1,792 @@
+
+import os
+import sys
+import json
+import time
+import pickle
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager, asynccontextmanager
+from collections import OrderedDict
+
+# Returned by QueryCache.get() when there is no live entry, since None is a
+# valid cached result
+MISS = object()
+
+
+def sizeof(value):
+    # Approximate memory held by a query result: the containers plus
+    # everything they hold (rows are lists/tuples of plain values)
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += sizeof(key) + sizeof(item)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += sizeof(item)
+    return size
+
+
+def freeze(value):
+    # Make bound parameters hashable so they can be part of a cache key
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(freeze(item) for item in value)
+    return value
+
+
+def database_of(conn):
+    # Path of the main database file behind a sqlite3 connection, so equal
+    # queries against different databases get different keys
+    for _, name, path in conn.execute("PRAGMA database_list"):
+        if name == "main":
+            return path or ":memory:"
+    return None
+
+
+async def adatabase_of(conn):
+    # database_of for an aiosqlite connection
+    cursor = await conn.execute("PRAGMA database_list")
+    try:
+        for _, name, path in await cursor.fetchall():
+            if name == "main":
+                return path or ":memory:"
+    finally:
+        await cursor.close()
+    return None
+
+
+def make_key(database, name, args=(), kwargs=None):
+    # Key for a call of the function `name` with the given arguments
+    # (the query text and its bound parameters) against `database`
+    key = (database, name, args, tuple(sorted(kwargs.items())) if kwargs else ())
+    try:
+        hash(key)
+        return key
+    except TypeError:
+        # Unhashable parameters, e.g. a list of ids
+        return (database, name, freeze(args), freeze(kwargs or {}))
+
+
+_WRITE_ACTIONS = (sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE, sqlite3.SQLITE_DELETE)
+
+
+class TableAccess:
+    # Tables read and written by the statements run while it is recording
+    def __init__(self):
+        self.read = set()
+        self.written = set()
+
+    def authorizer(self, action, arg1, arg2, db_name, trigger):
+        if arg1 and not arg1.startswith("sqlite_"):
+            if action == sqlite3.SQLITE_READ:
+                self.read.add(arg1)
+            elif action in _WRITE_ACTIONS:
+                self.written.add(arg1)
+        return sqlite3.SQLITE_OK
+
+
+# Trackers active on each connection, innermost last. Blocks nest: every
+# active TableAccess records every statement, so a cached read inside a
+# transactional function doesn't stop the transaction's writes from being
+# recorded. Keyed by id(conn); an entry only lives while its connection is
+# inside a tracking block.
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+def _recorder(stack):
+    def authorizer(action, arg1, arg2, db_name, trigger):
+        for access in tuple(stack):
+            access.authorizer(action, arg1, arg2, db_name, trigger)
+        return sqlite3.SQLITE_OK
+    return authorizer
+
+
+def _allow_all(action, arg1, arg2, db_name, trigger):
+    # Installed when the last tracker leaves: before Python 3.11
+    # set_authorizer(None) installs None as the callback and every later
+    # statement on the connection is refused
+    return sqlite3.SQLITE_OK
+
+
+def _push_tracker(conn):
+    # Returns (access, authorizer): the authorizer must be (re)installed
+    # even when blocks nest, because installing one expires the statements
+    # SQLite already prepared. Otherwise a statement the outer block
+    # prepared is reused from the statement cache without being authorized
+    # again and the inner block never sees its tables.
+    access = TableAccess()
+    stack = _trackers.setdefault(id(conn), [])
+    stack.append(access)
+    return access, _recorder(stack)
+
+
+def _pop_tracker(conn, access):
+    # Returns True when this was the last tracker on conn
+    stack = _trackers[id(conn)]
+    stack.remove(access)
+    if stack:
+        return False
+    del _trackers[id(conn)]
+    return True
+
+
+@contextmanager
+def track_tables(conn):
+    # Record which tables the statements prepared on conn inside the block
+    # read and write, using SQLite's authorizer hook (which sees every
+    # table a statement touches, including through views and triggers)
+    with _trackers_lock:
+        access, authorizer = _push_tracker(conn)
+        conn.set_authorizer(authorizer)
+    try:
+        yield access
+    finally:
+        with _trackers_lock:
+            if _pop_tracker(conn, access):
+                conn.set_authorizer(_allow_all)
+
+
+@asynccontextmanager
+async def atrack_tables(conn):
+    # track_tables for an aiosqlite connection. Coroutines tracking the same
+    # connection at once each record all of its statements, so an entry
+    # may list tables it didn't read (extra invalidations, never missed
+    # ones). aiosqlite runs calls in the order they are made, so the
+    # authorizer is in place before any statement queued inside the block.
+    access, authorizer = _push_tracker(conn)
+    await conn.set_authorizer(authorizer)
+    try:
+        yield access
+    finally:
+        if _pop_tracker(conn, access):
+            await conn.set_authorizer(_allow_all)
+
+
+class SingleFlight:
+    # Coalesces concurrent calls for the same key across threads: the first
+    # caller runs fn(), later callers block until it finishes and get its
+    # result (or exception) instead of running fn() themselves
+
+    def __init__(self):
+        self.executions = 0
+        self.shared = 0
+        self._calls = {}  # key -> Future of the call in flight
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+                self.executions += 1
+            else:
+                self.shared += 1
+        if not leader:
+            return call.result()
+        try:
+            result = fn()
+        except BaseException as err:
+            call.set_exception(err)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+# Handed to waiters when the leader of a flight was cancelled: they retry,
+# and one of them runs fn() instead
+_RETRY = object()
+
+
+class AsyncSingleFlight:
+    # SingleFlight for coroutines: fn is a coroutine function, and callers
+    # on the same event loop share one run of it. Cancelling a caller only
+    # cancels that caller; if it was running fn(), a waiter takes over.
+
+    def __init__(self):
+        self.executions = 0
+        self.shared = 0
+        self._calls = {}  # (loop, key) -> asyncio.Future of the call in flight
+
+    async def do(self, key, fn):
+        flight = (asyncio.get_running_loop(), key)
+        while True:
+            call = self._calls.get(flight)
+            if call is None:
+                break
+            self.shared += 1
+            # shield: a waiter being cancelled must not cancel the others
+            result = await asyncio.shield(call)
+            if result is not _RETRY:
+                return result
+        call = self._calls[flight] = flight[0].create_future()
+        self.executions += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            call.set_result(_RETRY)
+            raise
+        except BaseException as err:
+            call.set_exception(err)
+            call.exception()  # don't warn when nobody was waiting
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            del self._calls[flight]
+
+
+class InvalidationBus:
+    # Publish/subscribe channel for "these tables changed" events.
+    # Subscribers are called as callback(database, tables) in the
+    # publishing thread, so invalidation is done before publish() returns.
+
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        with self._lock:
+            if callback not in self._subscribers:
+                self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def publish(self, database, tables):
+        tables = frozenset(tables)
+        if not tables:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(database, tables)
+
+
+# Shared by transactional (publisher) and cache_query (subscriber)
+invalidation_bus = InvalidationBus()
+
+# Invalidation events kept in a shared store for other processes to replay
+INVALIDATION_LOG_SIZE = 10000
+
+
+class QueryCache:
+    # LRU cache of query results bounded by an estimated size in bytes,
+    # with a time-to-live per entry and hit/miss/eviction counters.
+    # Entries can record the tables they were read from, so that a write to
+    # a table drops just the entries that depend on it (invalidate()).
+    # Safe to share between threads.
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, ttl=300, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        # Bumped by every invalidate(); see set(since=...)
+        self.version = 0
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._tables = {}  # key -> (database, tables) for dependent entries
+        self._by_table = {}  # (database, table) -> keys read from it
+        self._untracked = set()  # keys with unknown dependencies
+        self._lock = threading.Lock()
+
+    def get(self, key, record=True):
+        # Return the cached value for key, or MISS if absent or expired.
+        # record=False leaves the hit/miss counters alone, for re-checks.
+        return self.lookup(key, 0, record)[0]
+
+    def lookup(self, key, max_stale=0, record=True):
+        # Return (value, fresh). An entry that expired less than max_stale
+        # seconds ago is still returned, with fresh=False, so the caller can
+        # serve it while refreshing; anything older is dropped and
+        # (MISS, False) returned.
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at = entry[2]
+                now = self.clock()
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += record
+                    return entry[0], True
+                if now < expires_at + max_stale:
+                    self._entries.move_to_end(key)
+                    self.stale_hits += record
+                    return entry[0], False
+                self._remove(key)
+                self.expirations += 1
+            self.misses += record
+            return MISS, False
+
+    def set(self, key, value, ttl=None, database=None, tables=None, since=None):
+        # Store value under key; ttl=None uses the cache default, and a
+        # default of None means entries never expire.
+        # tables: the tables in database the value was read from; entries
+        # stored without them are dropped by every invalidate().
+        # since: self.version read before the query ran; if an invalidation
+        # happened in between, the value may be stale and is not stored.
+        size = sizeof(value)
+        if size > self.max_bytes:
+            return False
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = self.clock() + ttl if ttl is not None else None
+        with self._lock:
+            if since is not None and since != self.version:
+                return False
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires_at)
+            self.bytes += size
+            if tables is None:
+                self._untracked.add(key)
+            else:
+                tables = frozenset(tables)
+                self._tables[key] = (database, tables)
+                for table in tables:
+                    self._by_table.setdefault((database, table), set()).add(key)
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+                return True
+            return False
+
+    def invalidate(self, database, tables):
+        # Drop the entries read from any of `tables` in `database`, plus
+        # those with unknown dependencies. Returns how many were dropped.
+        with self._lock:
+            self.version += 1
+            keys = set(self._untracked)
+            for table in tables:
+                keys |= self._by_table.get((database, table), set())
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tables.clear()
+            self._by_table.clear()
+            self._untracked.clear()
+            self.bytes = 0
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+        self._untracked.discard(key)
+        database, tables = self._tables.pop(key, (None, ()))
+        for table in tables:
+            keys = self._by_table.get((database, table))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[(database, table)]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            }
+
+
+def _canonical(value):
+    # Same key -> same bytes in every process (set order follows string
+    # hashes, which are randomized per process)
+    if isinstance(value, (set, frozenset)):
+        return ("<set>",) + tuple(sorted((_canonical(item) for item in value), key=repr))
+    if isinstance(value, tuple):
+        return tuple(_canonical(item) for item in value)
+    return value
+
+
+# SQLiteCacheStore connections a forked child found open; kept so they are
+# never closed in the child
+_inherited_connections = []
+
+
+class SQLiteCacheStore:
+    # Query results shared by every process on a host through one SQLite
+    # file in WAL mode. Values are pickled; each write runs in a
+    # BEGIN IMMEDIATE transaction, so readers see an entry either before or
+    # after an update, never half of it. Entries are evicted least recently
+    # used first (by last access, refreshed at most every touch_interval
+    # seconds) once their total size exceeds max_bytes. Expiry uses wall
+    # clock time since processes don't share a monotonic clock.
+    # Same interface as QueryCache, so it can replace it or sit behind it
+    # (TieredCache).
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, ttl=300,
+                 touch_interval=1.0, clock=time.time):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.touch_interval = touch_interval
+        self.clock = clock
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in (
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                " key BLOB PRIMARY KEY, value BLOB NOT NULL,"
+                " size INTEGER NOT NULL, expires_at REAL,"
+                " accessed_at REAL NOT NULL)",
+                "CREATE INDEX IF NOT EXISTS cache_entries_accessed"
+                " ON cache_entries (accessed_at)",
+                "CREATE TABLE IF NOT EXISTS cache_tables ("
+                " key BLOB NOT NULL, database TEXT, table_name TEXT NOT NULL)",
+                "CREATE INDEX IF NOT EXISTS cache_tables_key ON cache_tables (key)",
+                "CREATE INDEX IF NOT EXISTS cache_tables_table"
+                " ON cache_tables (database, table_name)",
+                # Every invalidate() is logged so other processes can apply
+                # it to their in-process tier (TieredCache.sync)
+                "CREATE TABLE IF NOT EXISTS cache_invalidations ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " database TEXT, tables TEXT NOT NULL)",
+                "CREATE TABLE IF NOT EXISTS cache_meta ("
+                " name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+                "INSERT OR IGNORE INTO cache_meta VALUES ('bytes', 0)",
+                "INSERT OR IGNORE INTO cache_meta VALUES ('evictions', 0)",
+                "INSERT OR IGNORE INTO cache_meta VALUES ('invalidations', 0)",
+            ):
+                conn.execute(statement)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _conn(self):
+        # One connection per thread and process; isolation_level=None so
+        # transactions are exactly the BEGIN/COMMIT issued here.
+        # A connection opened before fork() (e.g. at import under
+        # gunicorn --preload) must not be used by the child, nor closed
+        # there, so the child keeps it referenced and opens its own.
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid != os.getpid():
+            _inherited_connections.append(conn)
+            conn = None
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _write(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _key(key):
+        return pickle.dumps(_canonical(key), protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _delete(self, conn, keys):
+        # Remove entries inside a write transaction; returns how many existed
+        freed = 0
+        deleted = 0
+        for key in keys:
+            row = conn.execute("SELECT size FROM cache_entries WHERE key = ?",
+                               (key,)).fetchone()
+            conn.execute("DELETE FROM cache_tables WHERE key = ?", (key,))
+            if row is None:
+                continue
+            conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+            freed += row[0]
+            deleted += 1
+        if freed:
+            conn.execute("UPDATE cache_meta SET value = value - ? "
+                         "WHERE name = 'bytes'", (freed,))
+        return deleted
+
+    @property
+    def version(self):
+        # Sequence number of the last invalidation, shared by all processes
+        row = self._conn().execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'cache_invalidations'"
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get(self, key, record=True):
+        return self.lookup(key, 0, record)[0]
+
+    def lookup(self, key, max_stale=0, record=True):
+        value, fresh, _ = self.lookup_entry(key, max_stale, record)
+        return value, fresh
+
+    def dependencies(self, key):
+        # (database, tables) recorded for key, or (None, None) if unknown
+        rows = self._conn().execute(
+            "SELECT database, table_name FROM cache_tables WHERE key = ?",
+            (self._key(key),)).fetchall()
+        if not rows or any(table is None for _, table in rows):
+            return None, None
+        return rows[0][0], {table for _, table in rows}
+
+    def lookup_entry(self, key, max_stale=0, record=True):
+        # lookup() plus the entry's expires_at, for TieredCache
+        key = self._key(key)
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value, expires_at, accessed_at FROM cache_entries WHERE key = ?",
+            (key,)).fetchone()
+        now = self.clock()
+        if row is not None:
+            data, expires_at, accessed_at = row
+            fresh = expires_at is None or expires_at > now
+            if fresh or now < expires_at + max_stale:
+                if now - accessed_at >= self.touch_interval:
+                    conn.execute("UPDATE cache_entries SET accessed_at = ? "
+                                 "WHERE key = ?", (now, key))
+                if fresh:
+                    self.hits += record
+                else:
+                    self.stale_hits += record
+                return pickle.loads(data), fresh, expires_at
+            with self._write() as conn:
+                self._delete(conn, [key])
+        self.misses += record
+        return MISS, False, None
+
+    def set(self, key, value, ttl=None, database=None, tables=None, since=None):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        size = len(data)
+        if size > self.max_bytes:
+            return False
+        ttl = self.ttl if ttl is None else ttl
+        now = self.clock()
+        expires_at = now + ttl if ttl is not None else None
+        key = self._key(key)
+        with self._write() as conn:
+            if since is not None and since != self.version:
+                return False
+            self._delete(conn, [key])
+            conn.execute("INSERT INTO cache_entries VALUES (?, ?, ?, ?, ?)",
+                         (key, data, size, expires_at, now))
+            # NULL table marks an entry with unknown dependencies
+            conn.executemany(
+                "INSERT INTO cache_tables VALUES (?, ?, ?)",
+                [(key, database, table) for table in tables]
+                if tables is not None else [(key, None, None)])
+            conn.execute("UPDATE cache_meta SET value = value + ? "
+                         "WHERE name = 'bytes'", (size,))
+            (total,) = conn.execute(
+                "SELECT value FROM cache_meta WHERE name = 'bytes'").fetchone()
+            evicted = 0
+            while total > self.max_bytes:
+                oldest = conn.execute(
+                    "SELECT key, size FROM cache_entries WHERE key != ? "
+                    "ORDER BY accessed_at LIMIT 64", (key,)).fetchall()
+                if not oldest:
+                    break
+                for old_key, old_size in oldest:
+                    self._delete(conn, [old_key])
+                    total -= old_size
+                    evicted += 1
+                    if total <= self.max_bytes:
+                        break
+            if evicted:
+                conn.execute("UPDATE cache_meta SET value = value + ? "
+                             "WHERE name = 'evictions'", (evicted,))
+        return True
+
+    def delete(self, key):
+        with self._write() as conn:
+            return self._delete(conn, [self._key(key)]) > 0
+
+    def invalidate(self, database, tables):
+        # Drop entries read from any of `tables` in `database` (and those
+        # with unknown dependencies) for every process, and log the event
+        tables = sorted(tables)
+        with self._write() as conn:
+            marks = ", ".join("?" * len(tables))
+            keys = [key for (key,) in conn.execute(
+                "SELECT DISTINCT key FROM cache_tables WHERE table_name IS NULL "
+                f"OR (database IS ? AND table_name IN ({marks}))",
+                [database, *tables])]
+            self._delete(conn, keys)
+            conn.execute("INSERT INTO cache_invalidations (database, tables) "
+                         "VALUES (?, ?)", (database, json.dumps(tables)))
+            # Keep the log short; a reader that falls further behind clears
+            # its in-process tier instead (see TieredCache.sync)
+            conn.execute("DELETE FROM cache_invalidations WHERE seq <= "
+                         "(SELECT MAX(seq) FROM cache_invalidations) - ?",
+                         (INVALIDATION_LOG_SIZE,))
+            conn.execute("UPDATE cache_meta SET value = value + ? "
+                         "WHERE name = 'invalidations'", (len(keys),))
+        return len(keys)
+
+    def invalidations_since(self, seq):
+        # [(seq, database, tables)] logged after seq, or None when the log
+        # no longer reaches back that far
+        conn = self._conn()
+        (first,) = conn.execute(
+            "SELECT MIN(seq) FROM cache_invalidations").fetchone()
+        if first is not None and seq < first - 1:
+            return None
+        return [(row_seq, database, json.loads(tables))
+                for row_seq, database, tables in conn.execute(
+                    "SELECT seq, database, tables FROM cache_invalidations "
+                    "WHERE seq > ? ORDER BY seq", (seq,))]
+
+    def clear(self):
+        with self._write() as conn:
+            conn.execute("DELETE FROM cache_entries")
+            conn.execute("DELETE FROM cache_tables")
+            conn.execute("UPDATE cache_meta SET value = 0 WHERE name = 'bytes'")
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+
+    def stats(self):
+        conn = self._conn()
+        meta = dict(conn.execute("SELECT name, value FROM cache_meta"))
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self),
+            "bytes": meta["bytes"],
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": meta["evictions"],
+            "invalidations": meta["invalidations"],
+            "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+        }
+
+
+class TieredCache:
+    # An in-process QueryCache (L1) in front of a shared store (L2, e.g.
+    # SQLiteCacheStore), with the same interface as QueryCache. Lookups try
+    # L1, then L2, copying L2 hits into L1 for the rest of their ttl; sets
+    # and invalidations go to both. Invalidations made by other processes
+    # are read from the store's log and applied to L1 at most every
+    # sync_interval seconds (0: before every lookup), which bounds how long
+    # L1 can serve a result another process has invalidated.
+
+    def __init__(self, l1, l2, sync_interval=0):
+        self.l1 = l1
+        self.l2 = l2
+        self.sync_interval = sync_interval
+        self._seen = l2.version
+        self._synced_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def sync(self):
+        with self._lock:
+            self._synced_at = time.monotonic()
+            if self.l2.version == self._seen:
+                return
+            events = self.l2.invalidations_since(self._seen)
+            if events is None:
+                self.l1.clear()
+                self._seen = self.l2.version
+            else:
+                for seq, database, tables in events:
+                    self.l1.invalidate(database, tables)
+                    self._seen = seq
+
+    @property
+    def version(self):
+        return (self.l1.version, self.l2.version)
+
+    def get(self, key, record=True):
+        return self.lookup(key, 0, record)[0]
+
+    def lookup(self, key, max_stale=0, record=True):
+        if time.monotonic() - self._synced_at >= self.sync_interval:
+            self.sync()
+        value, fresh = self.l1.lookup(key, max_stale, record)
+        if fresh:
+            return value, fresh
+        shared, shared_fresh, expires_at = self.l2.lookup_entry(key, max_stale,
+                                                               record)
+        if shared is MISS:
+            return value, fresh
+        if shared_fresh:
+            ttl = None if expires_at is None else expires_at - self.l2.clock()
+            database, tables = self.l2.dependencies(key)
+            self.l1.set(key, shared, ttl=ttl, database=database, tables=tables)
+        return shared, shared_fresh
+
+    def set(self, key, value, ttl=None, database=None, tables=None, since=None):
+        l1_since, l2_since = since if since is not None else (None, None)
+        if not self.l2.set(key, value, ttl, database, tables, l2_since):
+            return False
+        return self.l1.set(key, value, ttl, database, tables, l1_since)
+
+    def delete(self, key):
+        self.l1.delete(key)
+        return self.l2.delete(key)
+
+    def invalidate(self, database, tables):
+        self.l1.invalidate(database, tables)
+        dropped = self.l2.invalidate(database, tables)
+        with self._lock:
+            # Our own event needs no replay; skip past it if nothing else
+            # was logged in between
+            if self._seen == self.l2.version - 1:
+                self._seen += 1
+        return dropped
+
+    def clear(self):
+        self.l1.clear()
+        self.l2.clear()
+
+    def __len__(self):
+        return len(self.l1)
+
+    def stats(self):
+        return {"l1": self.l1.stats(), "l2": self.l2.stats()}
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""Concurrency tests for cache_query single-flight coalescing"""
+
+import os
+import time
+import asyncio
+import sqlite3
+import tempfile
+import importlib
+import threading
+import unittest
+
+try:
+    import aiosqlite
+except ImportError:  # only needed for the async variant
+    aiosqlite = None
+
+from cache_engine import (MISS, QueryCache, SQLiteCacheStore, TieredCache,
+                          AsyncSingleFlight, adatabase_of, make_key)
+
+cache_query_module = importlib.import_module("4-cache_query")
+transactional_module = importlib.import_module("2-transactional")
+CALLERS = 16
+
+
+class CacheQueryTestCase(unittest.TestCase):
+    """Creates a users table in a scratch database and empties the cache"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "users.db")
+        conn = sqlite3.connect(self.path)
+        conn.execute("CREATE TABLE users (id INTEGER, email TEXT)")
+        conn.execute("INSERT INTO users VALUES (1, 'a@example.com')")
+        conn.execute("CREATE TABLE orders (id INTEGER, user_id INTEGER)")
+        conn.commit()
+        conn.close()
+        cache_query_module.query_cache.clear()
+        self.executions = 0
+
+
+class TestQueryCache(unittest.TestCase):
+    """Size bound, expiry and keys of the in-process cache"""
+
+    def setUp(self):
+        self.now = 0.0
+        self.cache = QueryCache(max_bytes=2000, ttl=10, clock=lambda: self.now)
+
+    def test_evicts_least_recently_used_past_max_bytes(self):
+        """Entries beyond max_bytes go oldest-use first"""
+        for i in range(20):
+            self.cache.set(("key", i), "x" * 200)
+            self.cache.get(("key", 0))  # keep the first entry in use
+        self.assertLessEqual(self.cache.bytes, 2000)
+        self.assertGreater(self.cache.evictions, 0)
+        self.assertEqual(self.cache.get(("key", 0)), "x" * 200)
+        self.assertEqual(self.cache.get(("key", 19)), "x" * 200)
+        self.assertIs(self.cache.get(("key", 1)), MISS)
+
+    def test_oversized_value_is_not_stored(self):
+        """A value larger than the whole cache is skipped"""
+        self.assertFalse(self.cache.set("key", "x" * 4000))
+        self.assertIs(self.cache.get("key"), MISS)
+        self.assertEqual(self.cache.bytes, 0)
+
+    def test_entry_expires_after_ttl(self):
+        """An entry is served until its ttl runs out, then dropped"""
+        self.cache.set("key", [(1,)])
+        self.now = 9.9
+        self.assertEqual(self.cache.get("key"), [(1,)])
+        self.now = 10.0
+        self.assertIs(self.cache.get("key"), MISS)
+        self.assertEqual(self.cache.expirations, 1)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_key_covers_database_and_parameters(self):
+        """Different databases or bound parameters give different keys"""
+        query = "SELECT * FROM users WHERE id = ?"
+        key = make_key("a.db", "fetch", (query, (1,)))
+        self.assertEqual(key, make_key("a.db", "fetch", (query, (1,))))
+        self.assertNotEqual(key, make_key("b.db", "fetch", (query, (1,))))
+        self.assertNotEqual(key, make_key("a.db", "fetch", (query, (2,))))
+        self.assertNotEqual(key, make_key("a.db", "fetch", (),
+                                          {"query": query, "params": (1,)}))
+        self.assertEqual(make_key("a.db", "fetch", (query, [1, 2])),
+                         make_key("a.db", "fetch", (query, [1, 2])))
+
+
+class TestCacheQueryKeys(CacheQueryTestCase):
+    """cache_query keys on the module-qualified function name"""
+
+    def test_same_name_in_other_module_has_own_entries(self):
+        """Two fetch functions from different modules don't share results"""
+        def fetch(conn, query):
+            self.executions += 1
+            return conn.execute(query).fetchall()
+
+        def other_fetch(conn, query):
+            self.executions += 1
+            return len(conn.execute(query).fetchall())
+        other_fetch.__qualname__ = fetch.__qualname__
+        other_fetch.__module__ = "reports"
+
+        first = cache_query_module.cache_query(fetch)
+        second = cache_query_module.cache_query(other_fetch)
+        conn = sqlite3.connect(self.path)
+        self.addCleanup(conn.close)
+        self.assertEqual(first(conn, query="SELECT * FROM users"),
+                         [(1, "a@example.com")])
+        self.assertEqual(second(conn, query="SELECT * FROM users"), 1)
+        self.assertEqual(self.executions, 2)
+
+
+class TestSingleFlightThreads(CacheQueryTestCase):
+    """N threads missing the same key run the query once"""
+
+    def test_concurrent_callers_share_one_execution(self):
+        """Every caller gets the rows from a single execution"""
+        @cache_query_module.cache_query
+        def slow_fetch(conn, query):
+            self.executions += 1
+            time.sleep(0.2)
+            return conn.execute(query).fetchall()
+
+        barrier = threading.Barrier(CALLERS)
+        results = []
+
+        def caller():
+            conn = sqlite3.connect(self.path)
+            try:
+                barrier.wait()
+                results.append(slow_fetch(conn, query="SELECT * FROM users"))
+            finally:
+                conn.close()
+
+        threads = [threading.Thread(target=caller) for _ in range(CALLERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.executions, 1)
+        self.assertEqual(results, [[(1, "a@example.com")]] * CALLERS)
+
+    def test_error_reaches_every_waiter(self):
+        """A failing execution raises in every coalesced caller"""
+        @cache_query_module.cache_query
+        def failing_fetch(conn, query):
+            self.executions += 1
+            time.sleep(0.2)
+            raise sqlite3.OperationalError("database is locked")
+
+        barrier = threading.Barrier(CALLERS)
+        errors = []
+
+        def caller():
+            conn = sqlite3.connect(self.path)
+            try:
+                barrier.wait()
+                failing_fetch(conn, query="SELECT * FROM users")
+            except sqlite3.OperationalError as err:
+                errors.append(err)
+            finally:
+                conn.close()
+
+        threads = [threading.Thread(target=caller) for _ in range(CALLERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.executions, 1)
+        self.assertEqual(len(errors), CALLERS)
+
+
+class TestTransactionalInvalidation(CacheQueryTestCase):
+    """Commits through transactional drop cached reads of the written tables"""
+
+    def setUp(self):
+        super().setUp()
+
+        @cache_query_module.cache_query
+        def read_emails(conn, query):
+            self.executions += 1
+            return conn.execute(query).fetchall()
+        self.read_emails = read_emails
+
+    def connect(self):
+        conn = sqlite3.connect(self.path)
+        self.addCleanup(conn.close)
+        return conn
+
+    def read(self):
+        return self.read_emails(self.connect(), query="SELECT email FROM users")
+
+    def test_commit_invalidates_cached_read(self):
+        """The read after a committed update sees the new value"""
+        @transactional_module.transactional
+        def update(conn, email):
+            conn.execute("UPDATE users SET email = ?", (email,))
+
+        self.assertEqual(self.read(), [("a@example.com",)])
+        update(self.connect(), "b@example.com")
+        self.assertEqual(self.read(), [("b@example.com",)])
+        self.assertEqual(self.executions, 2)
+
+    def test_cached_read_inside_transaction_keeps_tracking_writes(self):
+        """A cache_query miss inside transactional doesn't hide its writes"""
+        @transactional_module.transactional
+        def update(conn, email):
+            self.read_emails(conn, query="SELECT id FROM users")
+            conn.execute("UPDATE users SET email = ?", (email,))
+
+        self.assertEqual(self.read(), [("a@example.com",)])
+        update(self.connect(), "b@example.com")
+        self.assertEqual(self.read(), [("b@example.com",)])
+
+    def test_statement_prepared_before_cached_read_is_tracked(self):
+        """A read reusing a statement the transaction prepared records its tables"""
+        @transactional_module.transactional
+        def read_in_transaction(conn):
+            conn.execute("SELECT email FROM users").fetchall()
+            return self.read_emails(conn, query="SELECT email FROM users")
+
+        @transactional_module.transactional
+        def update(conn, email):
+            conn.execute("UPDATE users SET email = ?", (email,))
+
+        self.assertEqual(read_in_transaction(self.connect()), [("a@example.com",)])
+        update(self.connect(), "b@example.com")
+        self.assertEqual(self.read(), [("b@example.com",)])
+
+    def test_connection_usable_after_tracking(self):
+        """Leaving the outermost tracking block lets every statement run again"""
+        conn = self.connect()
+        self.read_emails(conn, query="SELECT email FROM users")
+        conn.execute("UPDATE users SET email = 'c@example.com'")
+        conn.commit()
+        self.assertEqual(conn.execute("SELECT email FROM users").fetchall(),
+                         [("c@example.com",)])
+
+
+class TestStaleWhileRevalidate(CacheQueryTestCase):
+    """Expired entries are served at once and refreshed in the background"""
+
+    def setUp(self):
+        super().setUp()
+        self.now = 0.0
+        cache = cache_query_module.query_cache
+        original_clock = cache.clock
+        cache.clock = lambda: self.now
+        self.addCleanup(setattr, cache, "clock", original_clock)
+
+        @cache_query_module.cache_query(stale_while_revalidate=60)
+        def fetch(conn, query):
+            self.executions += 1
+            return conn.execute(query).fetchall()
+        self.fetch = fetch
+
+    def call(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            return self.fetch(conn, query="SELECT email FROM users")
+        finally:
+            conn.close()
+
+    def wait_for_refreshes(self, timeout=5):
+        deadline = time.monotonic() + timeout
+        while cache_query_module.refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not cache_query_module.refreshing
+
+    def set_email(self, email):
+        conn = sqlite3.connect(self.path)
+        conn.execute("UPDATE users SET email = ?", (email,))
+        conn.commit()
+        conn.close()
+
+    def test_stale_value_served_then_refreshed(self):
+        """A stale hit returns the old rows and one refresh reloads them"""
+        self.assertEqual(self.call(), [("a@example.com",)])
+        self.set_email("b@example.com")  # outside transactional: no invalidation
+        self.now = 301.0
+        self.assertEqual(self.call(), [("a@example.com",)])
+        self.assertTrue(self.wait_for_refreshes())
+        self.assertEqual(self.call(), [("b@example.com",)])
+        self.assertEqual(self.executions, 2)
+
+    def test_too_stale_value_blocks(self):
+        """Past the staleness limit the query runs in the caller"""
+        self.call()
+        self.set_email("b@example.com")
+        self.now = 361.0
+        self.assertEqual(self.call(), [("b@example.com",)])
+        self.assertEqual(self.executions, 2)
+
+
+class TestSharedCache(unittest.TestCase):
+    """Two workers with their own L1 tier share one SQLite store"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "cache.db")
+        self.key = ("users.db", "fetch", ("SELECT * FROM users",), ())
+        self.rows = [(1, "a@example.com")]
+
+    def worker(self, **store_options):
+        return TieredCache(QueryCache(), SQLiteCacheStore(self.path, **store_options))
+
+    def test_result_cached_by_one_worker_is_shared(self):
+        """A result stored by one worker is served to the other from L2, then L1"""
+        first, second = self.worker(), self.worker()
+        first.set(self.key, self.rows, database="users.db", tables={"users"})
+        self.assertEqual(second.get(self.key), self.rows)
+        self.assertEqual(second.get(self.key), self.rows)
+        self.assertEqual(second.l2.hits, 1)
+        self.assertEqual(second.l1.hits, 1)
+
+    def test_invalidation_reaches_other_workers(self):
+        """A write in one worker drops the entry from the other's L1"""
+        first, second = self.worker(), self.worker()
+        first.set(self.key, self.rows, database="users.db", tables={"users"})
+        self.assertEqual(second.get(self.key), self.rows)
+        first.invalidate("users.db", {"users"})
+        self.assertIs(second.get(self.key), MISS)
+        self.assertIs(first.get(self.key), MISS)
+
+    def test_unrelated_write_keeps_entry(self):
+        """Only entries that read the written table are dropped"""
+        first, second = self.worker(), self.worker()
+        first.set(self.key, self.rows, database="users.db", tables={"users"})
+        second.get(self.key)
+        first.invalidate("users.db", {"orders"})
+        self.assertEqual(second.get(self.key), self.rows)
+
+    def test_store_evicts_least_recently_used(self):
+        """The shared store stays within max_bytes"""
+        store = SQLiteCacheStore(self.path, max_bytes=2000, touch_interval=0)
+        for i in range(20):
+            store.set(("key", i), "x" * 200, tables=())
+        stats = store.stats()
+        self.assertLessEqual(stats["bytes"], 2000)
+        self.assertGreater(stats["evictions"], 0)
+        self.assertEqual(store.get(("key", 19)), "x" * 200)
+        self.assertIs(store.get(("key", 0)), MISS)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs fork()")
+    def test_forked_child_opens_its_own_connection(self):
+        """A store opened before fork() is used over a new connection in the child"""
+        store = SQLiteCacheStore(self.path)
+        parent_conn = store._conn()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                ok = store._conn() is not parent_conn
+                store.set(self.key, self.rows, database="users.db", tables={"users"})
+            except BaseException:
+                ok = False
+            os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+        self.assertIs(store._conn(), parent_conn)
+        self.assertEqual(store.get(self.key), self.rows)
+
+
+@unittest.skipIf(aiosqlite is None, "aiosqlite is not installed")
+class TestSingleFlightAsync(CacheQueryTestCase):
+    """N coroutines missing the same key run the query once"""
+
+    def test_concurrent_coroutines_share_one_execution(self):
+        """Every coroutine gets the rows from a single execution"""
+        @cache_query_module.async_cache_query
+        async def slow_fetch(conn, query):
+            self.executions += 1
+            await asyncio.sleep(0.2)
+            cursor = await conn.execute(query)
+            rows = await cursor.fetchall()
+            await cursor.close()
+            return rows
+
+        async def run():
+            async with aiosqlite.connect(self.path) as conn:
+                return await asyncio.gather(*(
+                    slow_fetch(conn, query="SELECT * FROM users")
+                    for _ in range(CALLERS)))
+
+        results = asyncio.run(run())
+        self.assertEqual(self.executions, 1)
+        self.assertEqual(results, [[(1, "a@example.com")]] * CALLERS)
+
+
+    def test_concurrent_misses_record_their_tables(self):
+        """Coroutines sharing a connection don't lose each other's tables"""
+        @cache_query_module.async_cache_query
+        async def fetch(conn, query):
+            cursor = await conn.execute(query)
+            rows = await cursor.fetchall()
+            await cursor.close()
+            return rows
+
+        async def run():
+            async with aiosqlite.connect(self.path) as conn:
+                await asyncio.gather(fetch(conn, query="SELECT * FROM users"),
+                                     fetch(conn, query="SELECT * FROM orders"))
+                return await adatabase_of(conn)
+
+        database = asyncio.run(run())
+        cache = cache_query_module.query_cache
+        self.assertEqual(len(cache), 2)
+        cache.invalidate(database, {"users"})
+        cache.invalidate(database, {"orders"})
+        self.assertEqual(len(cache), 0)
+
+
+class TestAsyncSingleFlightCancellation(unittest.TestCase):
+    """Cancelling the leader of a flight doesn't cancel its waiters"""
+
+    def test_waiter_takes_over_from_cancelled_leader(self):
+        """A waiter runs the call itself and returns its result"""
+        flights = AsyncSingleFlight()
+        started = []
+
+        async def load():
+            started.append(1)
+            await asyncio.sleep(0.1)
+            return "rows"
+
+        async def run():
+            leader = asyncio.ensure_future(flights.do("key", load))
+            await asyncio.sleep(0)
+            waiter = asyncio.ensure_future(flights.do("key", load))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            result = await waiter
+            return leader.cancelled(), waiter.cancelled(), result
+
+        leader_cancelled, waiter_cancelled, result = asyncio.run(run())
+        self.assertTrue(leader_cancelled)
+        self.assertFalse(waiter_cancelled)
+        self.assertEqual(result, "rows")
+        self.assertEqual(len(started), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
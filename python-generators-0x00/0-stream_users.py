@@ -5,35 +5,44 @@ Generator function that streams user data rows from MySQL one by one
 """
 
 import mysql.connector
+from seed import pooled_connection, UserRow
 
 
-def stream_users():
+def stream_users(spec=None, compact_rows=False):
     """
     Connects to the ALX_prodev database and yields user rows one by one
     from the user_data table.
     Each row is returned as a dictionary.
-    """
-    try:
-        # Connect to the ALX_prodev database
-        connection = mysql.connector.connect(
-            host="localhost",
-            user="root",       # update if your username differs
-            password="",       # add password if applicable
-            database="ALX_prodev"
-        )
 
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM user_data;")
+    A seed.QuerySpec selects only the requested columns, rows and order
+    instead of SELECT *.
 
-        # Use a single loop to yield each row
-        for row in cursor:
-            yield row
+    With compact_rows=True rows are seed.UserRow objects (__slots__,
+    attribute and key access) instead of dicts, which take less memory
+    when callers keep many rows around.
+    """
+    if spec is None:
+        sql, params = "SELECT * FROM user_data;", ()
+    else:
+        sql, params = spec.to_sql("user_data")
+    cursor = None
+    try:
+        # Borrow an ALX_prodev connection from the shared pool
+        with pooled_connection() as connection:
+            try:
+                cursor = connection.cursor(dictionary=not compact_rows)
+                cursor.execute(sql, params)
+                to_row = UserRow.factory(cursor.column_names) if compact_rows else None
+
+                # Use a single loop to yield each row
+                for row in cursor:
+                    yield to_row(row) if to_row else row
+            finally:
+                if cursor:
+                    try:
+                        cursor.close()
+                    except Exception:
+                        pass
 
     except mysql.connector.Error as err:
         print(f"Database error: {err}")
-
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
@@ -4,8 +4,9 @@
 Batch streaming and processing of users from ALX_prodev.user_data
 
 Prototypes:
-- def stream_users_in_batches(batch_size)
-- def batch_processing(batch_size)
+- def stream_users_in_batches(batch_size, columnar=False, spec=None,
+                              read_ahead=0, compact_rows=False, adaptive=None)
+- def batch_processing(batch_size, columnar=False)
 
 Requirements:
 - Use yield (generator)
@@ -13,53 +14,90 @@ Requirements:
 """
 
 import mysql.connector
+from seed import pooled_connection, prefetch, QuerySpec, UserRow
+from columnar import ColumnBatch
 
 
-def stream_users_in_batches(batch_size):
+def fetch_batches(cursor, batch_size, columnar=False, compact_rows=False,
+                  adaptive=None):
+    """
+    Generator that yields fetchmany batches from an executed cursor,
+    converted to ColumnBatch objects when columnar is set or to lists of
+    UserRow objects when compact_rows is set. With a seed.AdaptiveFetchSize
+    the batch size is chosen by it instead of batch_size.
+    """
+    to_row = UserRow.factory(cursor.column_names) if compact_rows else None
+    # Single loop: fetch batches and yield them
+    while True:
+        if adaptive is not None:
+            batch = adaptive.fetch(cursor)
+        else:
+            batch = cursor.fetchmany(batch_size)
+        if not batch:
+            break
+        if columnar:
+            batch = ColumnBatch.from_rows(cursor.column_names, batch)
+        elif to_row:
+            batch = list(map(to_row, batch))
+        yield batch
+
+
+def stream_users_in_batches(batch_size, columnar=False, spec=None,
+                            read_ahead=0, compact_rows=False, adaptive=None):
     """
     Generator that yields batches (lists) of rows from user_data table.
     Each row is returned as a dictionary.
 
+    With columnar=True each batch is a columnar.ColumnBatch instead:
+    parallel per-column arrays with age as an integer array, which avoids
+    allocating a dict per row.
+
+    A seed.QuerySpec pushes column selection, filters and ordering down
+    into the SQL query.
+
+    With read_ahead=N a background thread fetches up to N batches ahead
+    of the caller (see seed.prefetch), overlapping network time with the
+    caller's processing.
+
+    With compact_rows=True rows are seed.UserRow objects instead of dicts.
+
+    Passing a seed.AdaptiveFetchSize lets it pick each batch size toward
+    its latency and byte targets (batch_size is then ignored); read its
+    size, history and stats() to monitor the choices.
+
     Yields:
-        list[dict]: up to `batch_size` rows per yield.
+        list[dict] | list[UserRow] | ColumnBatch: up to `batch_size` rows per yield.
     """
-    connection = None
+    sql, params = (spec or QuerySpec()).to_sql("user_data")
     cursor = None
     try:
-        connection = mysql.connector.connect(
-            host="localhost",
-            user="root",
-            password="",
-            database="ALX_prodev"
-        )
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT user_id, name, email, age FROM user_data;")
-
-        # Single loop: fetch batches and yield them
-        while True:
-            batch = cursor.fetchmany(batch_size)
-            if not batch:
-                break
-            yield batch
+        with pooled_connection() as connection:
+            try:
+                cursor = connection.cursor(
+                    dictionary=not (columnar or compact_rows))
+                cursor.execute(sql, params)
+
+                batches = fetch_batches(cursor, batch_size, columnar,
+                                        compact_rows, adaptive)
+                if read_ahead:
+                    batches = prefetch(batches, read_ahead)
+                # yield from closes the fetcher (and stops the read-ahead
+                # thread) before the cursor is closed below
+                yield from batches
+            finally:
+                if cursor:
+                    try:
+                        cursor.close()
+                    except Exception:
+                        pass
 
     except mysql.connector.Error as err:
         # Print error and stop iteration
         print(f"Database error: {err}")
         return
-    finally:
-        if cursor:
-            try:
-                cursor.close()
-            except Exception:
-                pass
-        if connection:
-            try:
-                connection.close()
-            except Exception:
-                pass
 
 
-def batch_processing(batch_size):
+def batch_processing(batch_size, columnar=False):
     """
     Processes batches produced by stream_users_in_batches(batch_size),
     filters users over the age of 25, prints each filtered user,
@@ -69,11 +107,20 @@ def batch_processing(batch_size):
       - outer loop over batches
       - inner loop over rows in a batch
 
+    The age > 25 condition is pushed down into the query so MySQL only
+    sends matching rows; the Python check below stays as a safeguard.
+    With columnar=True the filter also runs as one mask over each columnar
+    batch and only the selected rows are turned into dicts.
+
     Note: This function both prints and yields filtered users to match
     the checker behavior (printing seen in 2-main.py runs).
     """
     # Loop 1: iterate batches (generator from stream_users_in_batches)
-    for batch in stream_users_in_batches(batch_size):
+    spec = QuerySpec(where=[("age", ">", 25)])
+    for batch in stream_users_in_batches(batch_size, columnar=columnar,
+                                         spec=spec):
+        if columnar:
+            batch = batch.filter(batch.mask("age", ">", 25)).to_dicts()
         # Loop 2: iterate rows in the batch and filter
         for user in batch:
             try:
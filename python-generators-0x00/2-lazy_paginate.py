@@ -8,55 +8,220 @@ Prototypes required:
 
 Behavior:
 - paginate_users fetches a single page (LIMIT ... OFFSET ...)
+- paginate_users_after fetches a single page with keyset (seek) pagination:
+  rows whose primary key is greater than the last user_id already seen.
 - lazy_pagination yields pages (lists of dicts) one by one, fetching each
-  page only when needed. Starts at offset 0.
+  page only when needed. Starts at offset 0, or at the first user_id in
+  keyset mode.
 - Uses only one loop (while) and uses yield.
+- lazy_pagination(..., cache=PageCache(...)) serves pages already fetched
+  for the same snapshot_token() from memory.
 """
 
-from seed import connect_to_prodev
+import sys
+from collections import OrderedDict
+
+from seed import pooled_connection, UserRow, data_version
 import mysql.connector
 
 
-def paginate_users(page_size, offset):
+def page_bytes(page, sample=32):
+    """
+    Approximate memory held by a page: row objects plus their values,
+    extrapolated from the first `sample` rows.
+    """
+    if not page:
+        return sys.getsizeof(page)
+    head = page[:sample]
+    total = 0
+    for row in head:
+        total += sys.getsizeof(row)
+        total += sum(sys.getsizeof(value) for value in row.values())
+    return sys.getsizeof(page) + total * len(page) // len(head)
+
+
+class PageCache:
+    """
+    Bounded LRU cache of pages keyed by (page_size, page key, snapshot
+    token). Least recently used pages are evicted once the pages held
+    exceed `max_bytes` (as estimated by page_bytes). Pages are shared with
+    callers, so treat cached rows as read-only.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._pages = OrderedDict()
+
+    def get(self, key):
+        """Return the cached page for `key` (marking it recent), or None."""
+        entry = self._pages.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._pages.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, page):
+        """Cache `page` under `key`, evicting old pages to stay in budget."""
+        size = page_bytes(page)
+        if size > self.max_bytes:
+            return
+        old = self._pages.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self._pages[key] = (page, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted) = self._pages.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def clear(self):
+        self._pages.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self._pages)
+
+    @property
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        """Return the counters as a plain dict."""
+        return {
+            "pages": len(self._pages),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hit_ratio,
+        }
+
+
+def snapshot_token():
+    """
+    Token that changes whenever a change to user_data commits: the
+    trigger-maintained seed.data_version() counter. (MAX(updated_at) is not
+    enough: a transaction stamped earlier can commit after a later one.)
+    Returns None on a database error, which disables caching for that pass.
+    """
+    try:
+        with pooled_connection() as conn:
+            return data_version(conn)
+    except mysql.connector.Error as err:
+        print(f"Database error: {err}")
+        return None
+
+
+def _page(cursor, compact_rows):
+    rows = cursor.fetchall()
+    if compact_rows:
+        return list(map(UserRow.factory(cursor.column_names), rows))
+    return rows
+
+
+def paginate_users(page_size, offset, compact_rows=False):
     """
     Fetch a single page of rows from user_data.
-    Returns a list of rows (each row is a dict).
+    Returns a list of rows (each row is a dict, or a seed.UserRow with
+    compact_rows=True).
     """
-    conn = None
-    cur = None
     try:
-        conn = connect_to_prodev()
-        cur = conn.cursor(dictionary=True)
-        cur.execute(f"SELECT * FROM user_data LIMIT {page_size} OFFSET {offset}")
-        rows = cur.fetchall()
-        return rows
+        with pooled_connection() as conn:
+            cur = conn.cursor(dictionary=not compact_rows)
+            try:
+                cur.execute(f"SELECT * FROM user_data LIMIT {page_size} OFFSET {offset}")
+                return _page(cur, compact_rows)
+            finally:
+                cur.close()
     except mysql.connector.Error as err:
         # On DB error, print and return empty list to stop pagination
         print(f"Database error: {err}")
         return []
-    finally:
-        if cur:
+
+
+def paginate_users_after(page_size, last_user_id=None, compact_rows=False):
+    """
+    Fetch the page of rows that follows `last_user_id` in primary key order.
+    The database seeks straight to the key through the PRIMARY KEY index,
+    so every page costs the same no matter how deep into the table it is.
+    Returns a list of rows (each row is a dict, or a seed.UserRow with
+    compact_rows=True).
+    """
+    try:
+        with pooled_connection() as conn:
+            cur = conn.cursor(dictionary=not compact_rows)
             try:
+                if last_user_id is None:
+                    cur.execute(
+                        "SELECT * FROM user_data ORDER BY user_id LIMIT %s",
+                        (page_size,)
+                    )
+                else:
+                    cur.execute(
+                        "SELECT * FROM user_data WHERE user_id > %s "
+                        "ORDER BY user_id LIMIT %s",
+                        (last_user_id, page_size)
+                    )
+                return _page(cur, compact_rows)
+            finally:
                 cur.close()
-            except Exception:
-                pass
-        if conn:
-            try:
-                conn.close()
-            except Exception:
-                pass
+    except mysql.connector.Error as err:
+        # On DB error, print and return empty list to stop pagination
+        print(f"Database error: {err}")
+        return []
 
 
-def lazy_pagination(page_size):
+def lazy_pagination(page_size, keyset=False, compact_rows=False, cache=None,
+                    snapshot=None):
     """
     Generator that lazily yields pages of users (lists of dicts).
     Starts at offset 0 and fetches subsequent pages only when needed.
     Uses a single loop.
+
+    With keyset=True pages are ordered by user_id and each page resumes
+    after the last user_id of the previous one instead of using OFFSET,
+    which keeps a full walk of the table linear instead of quadratic.
+
+    With compact_rows=True pages hold seed.UserRow objects instead of
+    dicts, which matters when callers buffer pages.
+
+    With a PageCache, pages are looked up by (page_size, page key,
+    snapshot) before querying, so passes over the same snapshot re-read
+    recent pages from memory. `snapshot` defaults to snapshot_token(),
+    taken once when the pass starts; pass your own token to pin one
+    snapshot across jobs.
     """
     offset = 0
+    last_user_id = None
+    if cache is not None and snapshot is None:
+        snapshot = snapshot_token()
+    if snapshot is None:
+        cache = None
     while True:
-        page = paginate_users(page_size, offset)
+        if keyset:
+            page_key = ('after', last_user_id, compact_rows)
+        else:
+            page_key = ('offset', offset, compact_rows)
+        key = (page_size, page_key, snapshot)
+        page = cache.get(key) if cache is not None else None
+        if page is None:
+            if keyset:
+                page = paginate_users_after(page_size, last_user_id, compact_rows)
+            else:
+                page = paginate_users(page_size, offset, compact_rows)
+            if cache is not None and page:
+                cache.put(key, page)
         if not page:
             break
         yield page
         offset += page_size
+        last_user_id = page[-1]["user_id"]
@@ -8,12 +8,15 @@ the entire dataset into memory.
 Requirements:
 - Function stream_user_ages() that yields ages one by one
 - Function calculate_average_age() that uses the generator
+- Function calculate_age_statistics() that computes mean, variance,
+  min/max, histogram and percentiles in the same single pass
 - No more than two loops
 - Must print: "Average age of users: <average>"
 - Must NOT use SQL AVG()
 """
 
-from seed import connect_to_prodev
+from seed import pooled_connection, age_aggregate
+from age_stats import AgeStats
 import mysql.connector
 
 
@@ -22,39 +25,42 @@ def stream_user_ages():
     Generator that yields user ages one by one from the user_data table.
     Uses a single loop to stream results directly from the database.
     """
-    connection = None
     cursor = None
     try:
-        connection = connect_to_prodev()
-        cursor = connection.cursor()
-        cursor.execute("SELECT age FROM user_data;")
+        with pooled_connection() as connection:
+            try:
+                cursor = connection.cursor()
+                cursor.execute("SELECT age FROM user_data;")
 
-        # One loop to yield each age
-        for (age,) in cursor:
-            yield int(age)
+                # One loop to yield each age
+                for (age,) in cursor:
+                    yield int(age)
+            finally:
+                if cursor:
+                    try:
+                        cursor.close()
+                    except Exception:
+                        pass
 
     except mysql.connector.Error as err:
         print(f"Database error: {err}")
 
-    finally:
-        if cursor:
-            try:
-                cursor.close()
-            except Exception:
-                pass
-        if connection:
-            try:
-                connection.close()
-            except Exception:
-                pass
 
-
-def calculate_average_age():
+def calculate_average_age(use_aggregate=False):
     """
     Uses the stream_user_ages generator to calculate
     the average age without loading all rows into memory.
     Uses one loop to iterate through ages.
+
+    With use_aggregate=True the average is read from the trigger-maintained
+    user_age_histogram (seed.age_aggregate) instead of scanning user_data.
     """
+    if use_aggregate:
+        with pooled_connection() as connection:
+            stats = age_aggregate(connection)
+        print(f"Average age of users: {stats.mean:.2f}")
+        return
+
     total_age = 0
     count = 0
 
@@ -67,5 +73,20 @@ def calculate_average_age():
     print(f"Average age of users: {average:.2f}")
 
 
+def calculate_age_statistics():
+    """
+    Streams ages once through an AgeStats accumulator and prints the
+    mean, spread, range and p50/p95/p99. Returns the AgeStats so callers
+    can read the histogram or merge it with other shards.
+    """
+    stats = AgeStats().update(stream_user_ages())
+    summary = stats.summary()
+    print(f"Average age of users: {summary['mean']:.2f}")
+    print(f"Std dev: {summary['stddev']:.2f}, min: {summary['min']}, "
+          f"max: {summary['max']}, p50: {summary['p50']}, "
+          f"p95: {summary['p95']}, p99: {summary['p99']}")
+    return stats
+
+
 if __name__ == "__main__":
     calculate_average_age()
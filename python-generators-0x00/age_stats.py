@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+"""
+One-pass, mergeable statistics over a stream of ages.
+
+AgeStats keeps a constant-size state while values stream through it:
+- count, mean and variance (Welford's update, Chan's merge)
+- min and max
+- a histogram of ages, one bucket per whole year
+
+Percentiles are read off the histogram. Ages are whole numbers
+(DECIMAL(5,0) in user_data), so they are exact at one-year resolution while
+the state stays bounded by the number of distinct ages. Partial states
+computed on different shards combine with merge() (or +), giving the same
+result as a single pass over all of the data.
+
+Usage:
+    stats = AgeStats().update(stream_user_ages())
+    stats.mean, stats.variance, stats.percentile(95)
+    total = shard_a_stats + shard_b_stats
+"""
+
+import math
+
+
+class AgeStats:
+    """Streaming accumulator for count/mean/variance/min/max/histogram."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.histogram = {}
+
+    @classmethod
+    def from_histogram(cls, histogram):
+        """
+        Build the full state from an {age: count} histogram, e.g. one
+        maintained incrementally in the database.
+        """
+        stats = cls()
+        histogram = {int(age): int(n) for age, n in histogram.items() if n > 0}
+        if not histogram:
+            return stats
+        stats.count = sum(histogram.values())
+        stats.mean = sum(age * n for age, n in histogram.items()) / stats.count
+        stats.m2 = sum(n * (age - stats.mean) ** 2 for age, n in histogram.items())
+        stats.min = min(histogram)
+        stats.max = max(histogram)
+        stats.histogram = histogram
+        return stats
+
+    def add(self, age):
+        """Add one age to the running state."""
+        self.count += 1
+        delta = age - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (age - self.mean)
+        if self.min is None or age < self.min:
+            self.min = age
+        if self.max is None or age > self.max:
+            self.max = age
+        bucket = int(age)
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+        return self
+
+    def update(self, ages):
+        """Add every age from an iterable; returns self for chaining."""
+        for age in ages:
+            self.add(age)
+        return self
+
+    def merge(self, other):
+        """Fold another partial state into this one; returns self."""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            self.histogram = dict(other.histogram)
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        for bucket, n in other.histogram.items():
+            self.histogram[bucket] = self.histogram.get(bucket, 0) + n
+        return self
+
+    def __add__(self, other):
+        return AgeStats().merge(self).merge(other)
+
+    @property
+    def variance(self):
+        """Population variance (0 for fewer than two values)."""
+        return self.m2 / self.count if self.count > 1 else 0.0
+
+    @property
+    def stddev(self):
+        """Population standard deviation."""
+        return math.sqrt(self.variance)
+
+    def percentile(self, p):
+        """
+        Return the age at percentile `p` (0-100) using the nearest-rank
+        method over the histogram, or None when no ages were seen.
+        """
+        if self.count == 0:
+            return None
+        rank = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for bucket in sorted(self.histogram):
+            seen += self.histogram[bucket]
+            if seen >= rank:
+                return bucket
+        return self.max
+
+    def summary(self):
+        """Return the statistics as a plain dict."""
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "variance": self.variance,
+            "stddev": self.stddev,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
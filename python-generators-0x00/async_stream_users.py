@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+"""
+Async generator that streams user_data rows, for asyncio services.
+
+Prototypes:
+- async def astream_users(spec=None, prefetch=2, chunk_size=100,
+                          sqlite_path=None)
+- def seed_sqlite(sqlite_path, csv_file_path)
+
+Usage:
+    async for row in astream_users():
+        print(row)
+
+Rows are dicts, like 0-stream_users.stream_users. MySQL is reached through
+aiomysql with a server-side cursor. Passing sqlite_path (or setting
+USER_DATA_SQLITE) streams from an aiosqlite database instead, as a local
+stand-in for testing. seed_sqlite() builds such a database from
+user_data.csv.
+"""
+
+import os
+import sys
+import sqlite3
+import asyncio
+
+from seed import database_name, read_csv_rows
+
+try:
+    import aiomysql
+except ImportError:  # only needed for MySQL
+    aiomysql = None
+
+try:
+    import aiosqlite
+except ImportError:  # only needed for the SQLite stand-in
+    aiosqlite = None
+
+_DONE = object()
+
+
+async def _open(sqlite_path):
+    """
+    Open a connection and return (connection, cursor_factory, placeholder).
+    """
+    if sqlite_path:
+        if aiosqlite is None:
+            raise ImportError("aiosqlite is required for the SQLite stand-in")
+        connection = await aiosqlite.connect(sqlite_path)
+        connection.row_factory = sqlite3.Row
+        return connection, connection.cursor, '?'
+    if aiomysql is None:
+        raise ImportError("aiomysql is required to stream from MySQL")
+    connection = await aiomysql.connect(
+        host=os.getenv('MYSQL_HOST', '127.0.0.1'),
+        user=os.getenv('MYSQL_USER', 'root'),
+        password=os.getenv('MYSQL_PASSWORD', ''),
+        port=int(os.getenv('MYSQL_PORT', 3306)),
+        db=database_name(),
+    )
+    # SSDictCursor streams rows from the server instead of buffering them
+    return connection, lambda: connection.cursor(aiomysql.SSDictCursor), '%s'
+
+
+async def _close(connection):
+    if aiosqlite is not None and isinstance(connection, aiosqlite.Connection):
+        await connection.close()
+    else:
+        connection.close()
+
+
+async def astream_users(spec=None, prefetch=2, chunk_size=100, sqlite_path=None):
+    """
+    Async generator that yields user rows (dicts) one by one.
+
+    A background task fetches chunks of `chunk_size` rows into a queue
+    holding at most `prefetch` chunks, so the next round trip overlaps
+    with the consumer and a slow consumer pauses fetching. Cancelling the
+    consumer or leaving the loop early (aclose) cancels the fetch task and
+    closes the cursor and connection.
+
+    A seed.QuerySpec narrows the columns, rows and order like stream_users.
+    """
+    sqlite_path = sqlite_path or os.getenv('USER_DATA_SQLITE')
+    connection, cursor_factory, placeholder = await _open(sqlite_path)
+    cursor = None
+    fetcher = None
+    try:
+        if spec is None:
+            sql, params = "SELECT * FROM user_data", ()
+        else:
+            sql, params = spec.to_sql("user_data", placeholder=placeholder)
+        cursor = await cursor_factory()
+        await cursor.execute(sql, params)
+
+        chunks = asyncio.Queue(maxsize=prefetch)
+
+        async def fetch():
+            try:
+                while True:
+                    rows = await cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    await chunks.put((rows, None))
+                await chunks.put((_DONE, None))
+            except Exception as err:
+                await chunks.put((None, err))
+
+        fetcher = asyncio.create_task(fetch())
+        while True:
+            rows, err = await chunks.get()
+            if err is not None:
+                raise err
+            if rows is _DONE:
+                break
+            for row in rows:
+                yield dict(row)
+    except (sqlite3.Error, *((aiomysql.Error,) if aiomysql else ())) as err:
+        print(f"Database error: {err}")
+    finally:
+        if fetcher is not None:
+            fetcher.cancel()
+            await asyncio.gather(fetcher, return_exceptions=True)
+        if cursor is not None:
+            try:
+                await cursor.close()
+            except Exception:
+                pass
+        await _close(connection)
+
+
+def seed_sqlite(sqlite_path, csv_file_path):
+    """
+    Create a user_data table in a SQLite file and load a user_data CSV
+    into it, as a local stand-in for ALX_prodev.
+    """
+    connection = sqlite3.connect(sqlite_path)
+    try:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS user_data ("
+            "user_id TEXT PRIMARY KEY, name TEXT NOT NULL, "
+            "email TEXT NOT NULL, age INTEGER NOT NULL)"
+        )
+        connection.executemany(
+            "INSERT OR REPLACE INTO user_data (user_id, name, email, age) "
+            "VALUES (?, ?, ?, ?)",
+            read_csv_rows(csv_file_path)
+        )
+        connection.commit()
+    finally:
+        connection.close()
+
+
+async def _main(sqlite_path):
+    count = 0
+    async for row in astream_users(sqlite_path=sqlite_path):
+        if count < 6:
+            print(row)
+        count += 1
+    print(f"Streamed {count} rows")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else None))
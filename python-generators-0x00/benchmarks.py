@@ -0,0 +1,523 @@
+#!/usr/bin/python3
+"""
+Benchmarks for the user_data streaming generators.
+
+Usage:
+    ./benchmarks.py suite [rows ...]
+    ./benchmarks.py pagination [rows] [page_size]
+    ./benchmarks.py csv_parse [rows]
+    ./benchmarks.py batches [rows] [batch_size]
+    ./benchmarks.py parallel_scan [rows] [max_workers]
+    ./benchmarks.py row_memory [rows]
+    ./benchmarks.py pipeline [rows]
+    ./benchmarks.py writers [rows] [max_writers]
+
+Database benchmarks never write to ALX_prodev: they run against a scratch
+database (BENCH_DATABASE, default ALX_prodev_bench) on the server configured
+through the MYSQL_* environment variables used by seed.py, and top its
+user_data up with synthetic rows when it holds fewer than `rows` rows.
+
+The suite is the regression harness: for each size (default 10k, 1M and
+10M rows) it rebuilds the scratch user_data with exactly that many synthetic
+users, then measures
+rows/sec, time to first row and peak RSS of every streaming generator, each
+in a fresh process. Results are written as JSON to BENCH_OUTPUT (default
+benchmark-results-<timestamp>.json) so runs can be compared over time.
+"""
+
+import csv
+import os
+import sys
+import json
+import time
+import random
+import platform
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+import multiprocessing
+
+try:
+    import numpy as np
+except ImportError:  # NumPy only speeds up synthetic data generation
+    np = None
+
+import seed
+import bulk_loader
+import parallel_scan
+from pipeline import Pipeline
+
+stream_users = __import__('0-stream_users')
+batch_processing = __import__('1-batch_processing')
+lazy_paginate = __import__('2-lazy_paginate')
+stream_ages = __import__('4-stream_ages')
+
+
+def generate_users(rows, start=0, chunk_size=100000):
+    """
+    Generator yielding lists of synthetic (user_id, name, email, age)
+    tuples, `chunk_size` rows at a time. Random ids and ages are drawn for
+    a whole chunk at once (ages through NumPy when it is installed).
+    """
+    for offset in range(start, start + rows, chunk_size):
+        size = min(chunk_size, start + rows - offset)
+        raw = os.urandom(16 * size).hex()
+        if np is not None:
+            ages = np.random.randint(18, 101, size).tolist()
+        else:
+            ages = random.choices(range(18, 101), k=size)
+        ids = [f"{raw[j:j + 8]}-{raw[j + 8:j + 12]}-{raw[j + 12:j + 16]}-"
+               f"{raw[j + 16:j + 20]}-{raw[j + 20:j + 32]}"
+               for j in range(0, 32 * size, 32)]
+        yield [(uid, f"User {i}", f"user{i}@example.com", age)
+               for i, uid, age in zip(range(offset, offset + size), ids, ages)]
+
+
+def use_bench_database():
+    """
+    Point seed at the scratch database (MYSQL_DATABASE = BENCH_DATABASE,
+    default ALX_prodev_bench), creating it and user_data when missing.
+    Child processes inherit the setting. Returns a connection to it.
+    """
+    os.environ['MYSQL_DATABASE'] = os.getenv('BENCH_DATABASE', 'ALX_prodev_bench')
+    connection = seed.connect_db()
+    seed.create_database(connection)
+    connection.close()
+    connection = seed.connect_to_prodev()
+    seed.create_table(connection)
+    return connection
+
+
+def ensure_rows(connection, rows, batch_size=5000):
+    """
+    Make sure user_data holds at least `rows` rows, inserting synthetic
+    users in batches when it does not.
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM user_data")
+    (existing,) = cursor.fetchone()
+    missing = rows - existing
+    insert_sql = (
+        "INSERT INTO user_data (user_id, name, email, age) "
+        "VALUES (%s, %s, %s, %s)"
+    )
+    if missing > 0:
+        for batch in generate_users(missing, existing, batch_size):
+            cursor.executemany(insert_sql, batch)
+            connection.commit()
+        existing = rows
+    cursor.close()
+    return existing
+
+
+def bench_pagination(rows=1000000, page_size=1000):
+    """
+    Walk user_data once with OFFSET pagination and once with keyset
+    pagination, reporting total time and the latency of the first and
+    last pages of each walk.
+    """
+    conn = use_bench_database()
+    total = ensure_rows(conn, rows)
+    conn.close()
+    print(f"user_data rows: {total}, page size: {page_size}")
+
+    results = {}
+    for mode, keyset in (("offset", False), ("keyset", True)):
+        pages = 0
+        seen = 0
+        first_page = last_page = 0.0
+        start = time.perf_counter()
+        tick = start
+        for page in lazy_paginate.lazy_pagination(page_size, keyset=keyset):
+            now = time.perf_counter()
+            if pages == 0:
+                first_page = now - tick
+            last_page = now - tick
+            tick = now
+            pages += 1
+            seen += len(page)
+        elapsed = time.perf_counter() - start
+        results[mode] = elapsed
+        print(f"{mode:>7}: {seen} rows in {pages} pages, {elapsed:.2f}s total, "
+              f"first page {first_page * 1000:.1f}ms, "
+              f"last page {last_page * 1000:.1f}ms")
+
+    if results["keyset"]:
+        print(f"keyset speedup: {results['offset'] / results['keyset']:.1f}x")
+    return results
+
+
+def write_synthetic_csv(path, rows):
+    """Write a user_data CSV with `rows` synthetic users."""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(('user_id', 'name', 'email', 'age'))
+        for batch in generate_users(rows):
+            writer.writerows(batch)
+
+
+def dictreader_rows(csv_file_path):
+    """The CSV parsing insert_data did before read_csv_rows existed."""
+    with open(csv_file_path, newline='', encoding='utf-8') as csvfile:
+        for row in csv.DictReader(csvfile):
+            uid = row.get('user_id') or row.get('id') or row.get('uuid')
+            cleaned = seed.clean_row(uid, row.get('name'), row.get('email'),
+                                     row.get('age'))
+            if cleaned is not None:
+                yield cleaned
+
+
+def _measure_parse(parser_name, csv_file_path, results):
+    """Child process body: drain one parser and report time and peak RSS."""
+    parser = {"dictreader": dictreader_rows,
+              "mmap": seed.read_csv_rows}[parser_name]
+    start = time.perf_counter()
+    rows = sum(1 for _ in parser(csv_file_path))
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((parser_name, rows, elapsed, peak_kb))
+
+
+def bench_csv_parse(rows=1000000):
+    """
+    Parse a synthetic CSV with the old DictReader path and with
+    seed.read_csv_rows, each in a fresh process so peak RSS is comparable.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'user_data.csv')
+        write_synthetic_csv(path, rows)
+        size_mb = os.path.getsize(path) / 2 ** 20
+        print(f"CSV: {rows} rows, {size_mb:.1f} MiB")
+        for parser_name in ("dictreader", "mmap"):
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_measure_parse,
+                               args=(parser_name, path, queue))
+            proc.start()
+            name, parsed, elapsed, peak_kb = queue.get()
+            proc.join()
+            results[name] = {"rows": parsed, "seconds": elapsed,
+                             "rows_per_sec": parsed / elapsed,
+                             "peak_rss_kb": peak_kb}
+            print(f"{name:>10}: {parsed} rows in {elapsed:.2f}s "
+                  f"({parsed / elapsed:,.0f} rows/sec, "
+                  f"{size_mb / elapsed:.1f} MiB/s), peak RSS {peak_kb / 1024:.1f} MiB")
+    return results
+
+
+def bench_batches(rows=1000000, batch_size=1000):
+    """
+    Stream user_data in batches as row dicts and as columnar batches,
+    applying the age > 25 filter each way, and compare rows/sec and the
+    memory held by one batch.
+    """
+    conn = use_bench_database()
+    total = ensure_rows(conn, rows)
+    conn.close()
+    print(f"user_data rows: {total}, batch size: {batch_size}")
+
+    def dict_filter(batch):
+        return [user for user in batch if int(user["age"]) > 25]
+
+    def columnar_filter(batch):
+        return batch.filter(batch.mask("age", ">", 25))
+
+    results = {}
+    for mode, columnar, apply_filter in (("dict", False, dict_filter),
+                                         ("columnar", True, columnar_filter)):
+        # Memory held by one batch, measured on its own so tracemalloc
+        # does not slow the throughput pass down.
+        tracemalloc.start()
+        stream = batch_processing.stream_users_in_batches(batch_size, columnar)
+        first = next(stream)
+        batch_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        stream.close()
+        del first
+
+        streamed = kept = 0
+        start = time.perf_counter()
+        for batch in batch_processing.stream_users_in_batches(batch_size,
+                                                              columnar):
+            streamed += len(batch)
+            kept += len(apply_filter(batch))
+        elapsed = time.perf_counter() - start
+        results[mode] = {"rows": streamed, "kept": kept, "seconds": elapsed,
+                         "rows_per_sec": streamed / elapsed,
+                         "batch_bytes": batch_bytes}
+        print(f"{mode:>9}: {streamed} rows ({kept} over 25) in {elapsed:.2f}s "
+              f"({streamed / elapsed:,.0f} rows/sec), "
+              f"one batch holds {batch_bytes / 1024:.1f} KiB")
+    return results
+
+
+def bench_parallel_scan(rows=1000000, max_workers=8):
+    """
+    Compute age statistics over user_data with parallel_scan at 1, 2, 4,
+    ... up to `max_workers` workers and report the speedup over one worker.
+    """
+    conn = use_bench_database()
+    total = ensure_rows(conn, rows)
+    conn.close()
+    print(f"user_data rows: {total}")
+
+    results = {}
+    workers = 1
+    while workers <= max_workers:
+        start = time.perf_counter()
+        stats = parallel_scan.parallel_age_statistics(workers)
+        elapsed = time.perf_counter() - start
+        results[workers] = {"rows": stats.count, "seconds": elapsed,
+                            "rows_per_sec": stats.count / elapsed}
+        speedup = results[1]["seconds"] / elapsed
+        print(f"{workers} worker(s): {stats.count} rows in {elapsed:.2f}s "
+              f"({stats.count / elapsed:,.0f} rows/sec, {speedup:.2f}x)")
+        workers *= 2
+    return results
+
+
+def bench_writers(rows=1000000, max_writers=16):
+    """
+    Upsert `rows` pre-generated users into an emptied user_data in the
+    scratch database (BENCH_DATABASE) with bulk_loader.parallel_upsert at
+    1, 2, 4, ... up to `max_writers` writers and report the speedup over
+    one writer.
+    """
+    connection = use_bench_database()
+    chunks = list(generate_users(rows, chunk_size=10000))
+
+    results = {}
+    writers = 1
+    while writers <= max_writers:
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM user_data")
+        connection.commit()
+        cursor.close()
+        start = time.perf_counter()
+        written = bulk_loader.parallel_upsert(chunks, writers=writers)
+        elapsed = time.perf_counter() - start
+        results[writers] = {"rows": written, "seconds": elapsed,
+                            "rows_per_sec": written / elapsed}
+        speedup = results[1]["seconds"] / elapsed
+        print(f"{writers} writer(s): {written} rows in {elapsed:.2f}s "
+              f"({written / elapsed:,.0f} rows/sec, {speedup:.2f}x)")
+        writers *= 2
+    connection.close()
+    return results
+
+
+def bench_row_memory(rows=100000):
+    """
+    Compare the memory tracemalloc attributes to `rows` buffered rows held
+    as dicts and as seed.UserRow objects built from the same tuples.
+    """
+    tuples = [row for batch in generate_users(rows) for row in batch]
+    builders = {
+        "dict": lambda row: dict(zip(seed.USER_COLUMNS, row)),
+        "UserRow": seed.UserRow.factory(seed.USER_COLUMNS),
+    }
+    results = {}
+    for name, build in builders.items():
+        tracemalloc.start()
+        buffered = list(map(build, tuples))
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del buffered
+        results[name] = {"rows": rows, "bytes": size,
+                         "bytes_per_row": size / rows}
+        print(f"{name:>8}: {size / 2 ** 20:.1f} MiB for {rows} rows "
+              f"({size / rows:.0f} bytes/row, excluding shared values)")
+    return results
+
+
+def bench_pipeline(rows=1000000):
+    """
+    Run the same map -> filter -> map chain over in-memory rows as stacked
+    generators (one per stage, like the scripts in this directory) and as a
+    fused Pipeline, reporting rows/sec.
+    """
+    data = [row for batch in generate_users(rows) for row in batch]
+
+    def get_age(row):
+        return row[3]
+
+    def is_adult(age):
+        return age > 25
+
+    def double(age):
+        return age * 2
+
+    def map_stage(fn, items):
+        for item in items:
+            yield fn(item)
+
+    def filter_stage(pred, items):
+        for item in items:
+            if pred(item):
+                yield item
+
+    def stacked():
+        ages = map_stage(get_age, data)
+        adults = filter_stage(is_adult, ages)
+        return sum(1 for _ in map_stage(double, adults))
+
+    def fused():
+        return (Pipeline.from_iterable(data)
+                .map(get_age)
+                .filter(is_adult)
+                .map(double)
+                .count())
+
+    results = {}
+    for name, run in (("generators", stacked), ("pipeline", fused)):
+        start = time.perf_counter()
+        kept = run()
+        elapsed = time.perf_counter() - start
+        results[name] = {"rows": rows, "kept": kept, "seconds": elapsed,
+                         "rows_per_sec": rows / elapsed}
+        print(f"{name:>10}: {rows} rows ({kept} kept) in {elapsed:.2f}s "
+              f"({rows / elapsed:,.0f} rows/sec)")
+    return results
+
+
+SUITE_SIZES = (10000, 1000000, 10000000)
+# OFFSET pagination is quadratic; past this size a walk takes hours
+OFFSET_MAX_ROWS = 1000000
+
+
+def _stream_rows():
+    connection = seed.connect_to_prodev()
+    try:
+        yield from seed.stream_rows(connection, chunk_size=1000)
+    finally:
+        connection.close()
+
+
+# name -> (generator factory, whether it yields lists of rows)
+SUITE_GENERATORS = {
+    "stream_users": (lambda: stream_users.stream_users(), False),
+    "stream_users_in_batches": (
+        lambda: batch_processing.stream_users_in_batches(1000), True),
+    "lazy_pagination": (
+        lambda: lazy_paginate.lazy_pagination(1000, keyset=True), True),
+    "lazy_pagination_offset": (
+        lambda: lazy_paginate.lazy_pagination(1000), True),
+    "stream_user_ages": (lambda: stream_ages.stream_user_ages(), False),
+    "stream_rows": (_stream_rows, False),
+}
+
+
+def seed_benchmark_table(rows):
+    """
+    Rebuild user_data in the current database with exactly `rows`
+    synthetic users, loaded through the bulk loader.
+    """
+    connection = seed.connect_db()
+    seed.create_database(connection)
+    connection.close()
+
+    connection = seed.connect_to_prodev()
+    seed.create_table(connection)
+    cursor = connection.cursor()
+    cursor.execute("TRUNCATE TABLE user_data")
+    connection.commit()
+    cursor.close()
+    # TRUNCATE doesn't fire the delete triggers; reset the histogram too
+    seed.rebuild_age_aggregate(connection)
+    connection.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'user_data.csv')
+        write_synthetic_csv(path, rows)
+        bulk_loader.bulk_insert_data(path)
+
+
+def _measure_generator(name, results):
+    """Child process body: drain one generator and report its metrics."""
+    factory, batched = SUITE_GENERATORS[name]
+    rows = 0
+    first_row = None
+    start = time.perf_counter()
+    for item in factory():
+        if first_row is None:
+            first_row = time.perf_counter() - start
+        rows += len(item) if batched else 1
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put({
+        "generator": name,
+        "rows": rows,
+        "seconds": elapsed,
+        "rows_per_sec": rows / elapsed if elapsed > 0 else 0.0,
+        "time_to_first_row_ms": (first_row or 0.0) * 1000,
+        "peak_rss_kb": peak_kb,
+    })
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_suite(*sizes):
+    """
+    Run every generator in SUITE_GENERATORS at each size and write the
+    results as JSON. Returns the report dict.
+    """
+    sizes = sizes or SUITE_SIZES
+    use_bench_database().close()
+    output = os.getenv('BENCH_OUTPUT') or time.strftime(
+        'benchmark-results-%Y%m%d-%H%M%S.json')
+    report = {
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": os.environ['MYSQL_DATABASE'],
+        "results": [],
+    }
+    ctx = multiprocessing.get_context("spawn")
+    for rows in sizes:
+        print(f"Seeding {rows} rows into {os.environ['MYSQL_DATABASE']}.user_data")
+        seed_benchmark_table(rows)
+        for name in SUITE_GENERATORS:
+            if name == "lazy_pagination_offset" and rows > OFFSET_MAX_ROWS:
+                continue
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_measure_generator, args=(name, queue))
+            proc.start()
+            result = queue.get()
+            proc.join()
+            result["table_rows"] = rows
+            report["results"].append(result)
+            print(f"{rows:>9} {name:<24} {result['rows_per_sec']:>12,.0f} rows/sec  "
+                  f"first row {result['time_to_first_row_ms']:8.1f}ms  "
+                  f"peak RSS {result['peak_rss_kb'] / 1024:7.1f} MiB")
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+    return report
+
+
+BENCHMARKS = {
+    "suite": bench_suite,
+    "pagination": bench_pagination,
+    "csv_parse": bench_csv_parse,
+    "batches": bench_batches,
+    "parallel_scan": bench_parallel_scan,
+    "row_memory": bench_row_memory,
+    "pipeline": bench_pipeline,
+    "writers": bench_writers,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"usage: {sys.argv[0]} {{{','.join(BENCHMARKS)}}} [args...]")
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](*(int(arg) for arg in sys.argv[2:]))
@@ -0,0 +1,363 @@
+#!/usr/bin/python3
+"""
+High-throughput loader for ALX_prodev.user_data.
+
+Prototypes:
+- def csv_byte_ranges(csv_file_path, chunk_bytes, start=0)
+- def parse_range(task)
+- def partition(rows, writers)
+- class UpsertWriters(writers=4, batch_size=1000, commit_size=10000,
+                     max_retries=5)
+- def parallel_upsert(chunks, writers=4, batch_size=1000, commit_size=10000,
+                      max_retries=5)
+- def bulk_insert_data(csv_file_path, workers=None, writers=4,
+                       batch_size=1000, commit_size=10000,
+                       chunk_bytes=8 * 1024 * 1024, local_infile=False)
+
+How it works:
+- The CSV is split into byte ranges that end on line boundaries.
+- A process pool parses the ranges with seed.read_csv_rows into
+  (user_id, name, email, age) tuples, validated like seed.insert_data.
+- Parsed rows are partitioned by CRC32(user_id) across writer threads,
+  each with its own connection and queue, so writers never contend for
+  the same keys. Each upserts `batch_size` rows per executemany, commits
+  every `commit_size` rows, and replays a transaction that hit a deadlock
+  or lock wait timeout.
+- With local_infile=True the file is handed to the server in one
+  LOAD DATA LOCAL INFILE statement instead (no client-side validation).
+
+Range boundaries are placed on newlines, so records must not contain
+embedded newlines, which holds for the user_data.csv exports this project
+seeds from.
+"""
+
+import os
+import re
+import sys
+import time
+import queue
+import zlib
+import threading
+from collections import deque
+from operator import itemgetter
+from concurrent.futures import ProcessPoolExecutor
+
+import mysql.connector
+
+import seed
+
+
+def read_header(csv_file_path):
+    """
+    Read the CSV header line.
+    Returns (columns, data_start) where columns is the seed.csv_columns()
+    mapping and data_start is the byte offset of the first record.
+    """
+    with open(csv_file_path, 'rb') as f:
+        columns = seed.csv_columns(f.readline())
+        data_start = f.tell()
+    return columns, data_start
+
+
+def csv_byte_ranges(csv_file_path, chunk_bytes, start=0):
+    """
+    Generator that yields (start, end) byte ranges of roughly `chunk_bytes`
+    bytes covering the file from `start`, each ending just after a newline.
+    """
+    size = os.path.getsize(csv_file_path)
+    with open(csv_file_path, 'rb') as f:
+        pos = start
+        while pos < size:
+            end = min(pos + chunk_bytes, size)
+            if end < size:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            yield pos, end
+            pos = end
+
+
+def parse_range(task):
+    """
+    Parse one byte range of the CSV in a worker process.
+    `task` is (csv_file_path, start, end, columns).
+    Returns a list of cleaned (user_id, name, email, age) tuples.
+    """
+    csv_file_path, start, end, columns = task
+    return list(seed.read_csv_rows(csv_file_path, start, end, columns))
+
+
+# InnoDB errors that roll back the transaction and are worth replaying
+RETRY_ERRNOS = (1213, 1205)  # ER_LOCK_DEADLOCK, ER_LOCK_WAIT_TIMEOUT
+
+
+def partition(rows, writers):
+    """
+    Split rows into `writers` lists by CRC32(user_id) % writers.
+
+    A key always lands on the same writer, so writers never update the
+    same rows. The modulus matches seed's user_age_histogram slots
+    (CRC32(user_id) % AGE_AGGREGATE_SLOTS); when `writers` divides
+    AGE_AGGREGATE_SLOTS each writer's triggers also touch their own
+    histogram slots only.
+    """
+    parts = [[] for _ in range(writers)]
+    for row in rows:
+        parts[zlib.crc32(row[0].encode('utf-8')) % writers].append(row)
+    return parts
+
+
+class _Writer(threading.Thread):
+    """
+    Writer thread that upserts row chunks from its own queue over its own
+    connection. Rows are written in transactions of about `commit_size`
+    rows; a transaction rolled back by a deadlock or lock wait timeout is
+    replayed up to `max_retries` times. A None chunk tells it to commit
+    and stop.
+    """
+
+    def __init__(self, batch_size, commit_size, max_retries=5,
+                 retry_delay=0.05, depth=2):
+        super().__init__(daemon=True)
+        self.chunks = queue.Queue(maxsize=depth)
+        self.batch_size = batch_size
+        self.commit_size = commit_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.rows = 0
+        self.retries = 0
+        self.error = None
+
+    def _commit(self, connection, cursor, rows):
+        """Write `rows` in one transaction, replaying it on deadlock."""
+        # Locking keys in order keeps this writer's batches from deadlocking
+        # with themselves through secondary index gap locks
+        rows.sort(key=itemgetter(0))
+        attempt = 0
+        while True:
+            try:
+                for i in range(0, len(rows), self.batch_size):
+                    cursor.executemany(seed.UPSERT_SQL,
+                                       rows[i:i + self.batch_size])
+                connection.commit()
+                self.rows += len(rows)
+                return
+            except mysql.connector.Error as err:
+                connection.rollback()
+                if err.errno not in RETRY_ERRNOS or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+    def run(self):
+        connection = None
+        cursor = None
+        pending = []
+        done = False
+        try:
+            connection = seed.connect_to_prodev()
+            if connection is None:
+                raise mysql.connector.Error("writer could not connect")
+            cursor = connection.cursor()
+            while True:
+                chunk = self.chunks.get()
+                if chunk is None:
+                    done = True
+                    break
+                pending.extend(chunk)
+                if len(pending) >= self.commit_size:
+                    self._commit(connection, cursor, pending)
+                    pending = []
+            if pending:
+                self._commit(connection, cursor, pending)
+        except Exception as err:
+            self.error = err
+            if connection is not None:
+                try:
+                    connection.rollback()
+                except Exception:
+                    pass
+            # Keep draining so the producer never blocks on a dead writer
+            while not done:
+                done = self.chunks.get() is None
+        finally:
+            if cursor:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+            if connection:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+
+
+class UpsertWriters:
+    """
+    K writer threads with one connection each, fed by key hash.
+
+    Usage:
+        with UpsertWriters(writers=8) as sink:
+            for rows in parsed_chunks:
+                sink.put(rows)
+        sink.rows, sink.retries
+
+    put() partitions a chunk of (user_id, name, email, age) tuples with
+    partition() and hands each part to its writer, blocking while that
+    writer is behind. Leaving the block flushes and joins the writers
+    and re-raises the first writer error.
+    """
+
+    def __init__(self, writers=4, batch_size=1000, commit_size=10000,
+                 max_retries=5):
+        self.threads = [_Writer(batch_size, commit_size, max_retries)
+                        for _ in range(writers)]
+        for writer in self.threads:
+            writer.start()
+
+    def put(self, rows):
+        for writer, part in zip(self.threads, partition(rows, len(self.threads))):
+            if part:
+                writer.chunks.put(part)
+
+    def close(self, raise_errors=True):
+        for writer in self.threads:
+            writer.chunks.put(None)
+        for writer in self.threads:
+            writer.join()
+        errors = [w.error for w in self.threads if w.error is not None]
+        if errors and raise_errors:
+            raise errors[0]
+
+    @property
+    def rows(self):
+        return sum(w.rows for w in self.threads)
+
+    @property
+    def retries(self):
+        return sum(w.retries for w in self.threads)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Don't let a writer error mask the exception that ended the block
+        self.close(raise_errors=exc_type is None)
+
+
+def parallel_upsert(chunks, writers=4, batch_size=1000, commit_size=10000,
+                    max_retries=5):
+    """
+    Upsert pre-parsed rows, given as an iterable of lists of
+    (user_id, name, email, age) tuples, through `writers` connections.
+    Returns the number of rows written.
+    """
+    with UpsertWriters(writers, batch_size, commit_size, max_retries) as sink:
+        for rows in chunks:
+            sink.put(rows)
+    return sink.rows
+
+
+def _report(csv_file_path, rows, started):
+    elapsed = time.perf_counter() - started
+    rate = rows / elapsed if elapsed > 0 else 0.0
+    print(f"Loaded {rows} rows from {csv_file_path} in {elapsed:.2f}s "
+          f"({rate:,.0f} rows/sec)")
+    return {"rows": rows, "seconds": elapsed, "rows_per_sec": rate}
+
+
+LOAD_DATA_INFO = re.compile(
+    r"Records: (?P<records>\d+)\s+Deleted: \d+\s+Skipped: (?P<skipped>\d+)")
+
+
+def _records_loaded(result):
+    """
+    Rows loaded by a LOAD DATA statement, from the info message of its OK
+    packet ("Records: 3  Deleted: 1  Skipped: 0  Warnings: 0"). The affected
+    row count can't be used: REPLACE counts every overwritten row twice.
+    """
+    match = LOAD_DATA_INFO.search(result.get('info_msg') or '')
+    if match is None:
+        raise mysql.connector.InterfaceError(
+            f"unexpected LOAD DATA result: {result!r}")
+    return int(match.group('records')) - int(match.group('skipped'))
+
+
+def _load_data_infile(csv_file_path, columns):
+    """Load the whole file with LOAD DATA LOCAL INFILE."""
+    width = max(columns.values()) + 1
+    targets = ['@skip'] * width
+    targets[columns['user_id']] = 'user_id'
+    targets[columns['name']] = 'name'
+    targets[columns['email']] = 'email'
+    targets[columns['age']] = '@age'
+    # use_pure: only the pure-Python protocol returns the OK packet, and
+    # with it the info message, from cmd_query
+    connection = seed.connect_to_prodev(allow_local_infile=True, use_pure=True)
+    if connection is None:
+        raise mysql.connector.Error("could not connect for LOAD DATA")
+    path = connection.converter.escape(os.path.abspath(csv_file_path))
+    load_sql = (
+        f"LOAD DATA LOCAL INFILE '{path}' REPLACE INTO TABLE user_data "
+        "CHARACTER SET utf8mb4 "
+        "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+        "LINES TERMINATED BY '\\n' IGNORE 1 LINES "
+        # TRUNCATE drops the fraction like seed.clean_row's int(float(age))
+        f"({', '.join(targets)}) SET age = TRUNCATE(@age, 0)"
+    )
+    try:
+        result = connection.cmd_query(load_sql)
+        connection.commit()
+        return _records_loaded(result)
+    except mysql.connector.Error:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+def bulk_insert_data(csv_file_path, workers=None, writers=4, batch_size=1000,
+                     commit_size=10000, chunk_bytes=8 * 1024 * 1024,
+                     local_infile=False):
+    """
+    Load a user_data CSV using a pool of parser processes and several
+    writer connections. Returns {"rows", "seconds", "rows_per_sec"}.
+
+    workers:      parser processes (default: os.cpu_count())
+    writers:      writer threads, each with its own connection
+    batch_size:   rows per executemany call
+    commit_size:  rows per transaction on each writer
+    chunk_bytes:  approximate size of each parsed byte range
+    local_infile: use LOAD DATA LOCAL INFILE instead of parsing in Python
+    """
+    if not os.path.exists(csv_file_path):
+        raise FileNotFoundError(f"CSV file not found: {csv_file_path}")
+
+    started = time.perf_counter()
+    columns, data_start = read_header(csv_file_path)
+    if local_infile:
+        rows = _load_data_infile(csv_file_path, columns)
+        return _report(csv_file_path, rows, started)
+
+    workers = workers or os.cpu_count() or 1
+    with UpsertWriters(writers, batch_size, commit_size) as sink, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        # Keep a bounded window of ranges in flight so parsed rows
+        # never pile up faster than the writers can drain them.
+        in_flight = deque()
+        for start, end in csv_byte_ranges(csv_file_path, chunk_bytes,
+                                          data_start):
+            in_flight.append(pool.submit(
+                parse_range, (csv_file_path, start, end, columns)))
+            if len(in_flight) >= workers * 2:
+                sink.put(in_flight.popleft().result())
+        while in_flight:
+            sink.put(in_flight.popleft().result())
+    return _report(csv_file_path, sink.rows, started)
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else 'user_data.csv'
+    bulk_insert_data(path, local_infile='--local-infile' in sys.argv)
@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+"""
+Columnar batches of user_data rows.
+
+A ColumnBatch keeps one batch of rows as parallel columns instead of one
+dict per row: string columns are lists and integer columns (age) are
+numpy.ndarray when NumPy is installed, array('i') otherwise. Filters such
+as age > 25 then run as a single mask over the whole batch.
+
+Usage:
+    batch = ColumnBatch.from_rows(cursor.column_names, cursor.fetchmany(500))
+    adults = batch.filter(batch.mask('age', '>', 25))
+    adults.age, adults.email, adults.to_dicts()
+"""
+
+import operator
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional
+    np = None
+
+INT_COLUMNS = ('age',)
+
+OPERATORS = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+def int_column(values):
+    """Pack integer values (ints or Decimals) into a compact array."""
+    if np is not None:
+        return np.fromiter(map(int, values), dtype=np.int32, count=len(values))
+    return array('i', map(int, values))
+
+
+class ColumnBatch:
+    """
+    One batch of rows stored column by column.
+    Columns are available as batch.columns[name] and as batch.<name>.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    @classmethod
+    def from_rows(cls, names, rows):
+        """Build a batch from a list of row tuples and their column names."""
+        values = list(zip(*rows)) if rows else [()] * len(names)
+        columns = {}
+        for name, column in zip(names, values):
+            if name in INT_COLUMNS:
+                columns[name] = int_column(column)
+            else:
+                columns[name] = list(column)
+        return cls(columns)
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['columns'][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()), ()))
+
+    def mask(self, name, op, value):
+        """
+        Compare a whole column with `value` using one of OPERATORS.
+        Returns a boolean array (NumPy) or list, one entry per row.
+        """
+        compare = OPERATORS[op]
+        column = self.columns[name]
+        if np is not None and isinstance(column, np.ndarray):
+            return compare(column, value)
+        return [compare(v, value) for v in column]
+
+    def filter(self, mask):
+        """Return a new batch holding only the rows where `mask` is true."""
+        if np is not None:
+            keep = np.flatnonzero(mask)
+        else:
+            keep = [i for i, selected in enumerate(mask) if selected]
+        columns = {}
+        for name, column in self.columns.items():
+            if np is not None and isinstance(column, np.ndarray):
+                columns[name] = column[keep]
+            elif isinstance(column, array):
+                columns[name] = array(column.typecode, (column[i] for i in keep))
+            else:
+                columns[name] = [column[i] for i in keep]
+        return ColumnBatch(columns)
+
+    def to_dicts(self):
+        """Materialize the batch as a list of row dicts."""
+        names = list(self.columns)
+        values = [column.tolist() if hasattr(column, 'tolist') else column
+                  for column in self.columns.values()]
+        return [dict(zip(names, row)) for row in zip(*values)]
@@ -0,0 +1,140 @@
+#!/usr/bin/python3
+"""
+Parallel scan of ALX_prodev.user_data across a process pool.
+
+Prototypes:
+- def key_ranges(shards)
+- def parallel_scan(accumulate, merge, columns=None, where=(), workers=None,
+                    shards=None, chunk_size=1000)
+- def parallel_age_statistics(workers=None)
+
+The table is split into primary-key ranges. Each worker process streams
+its ranges over its own connection with seed.stream_rows and reduces them
+with `accumulate`. The driver then folds the per-shard results together
+with `merge`. Both must be module-level functions so they can be pickled
+into the workers.
+"""
+
+import os
+import sys
+from functools import reduce
+from concurrent.futures import ProcessPoolExecutor
+
+import mysql.connector
+
+import seed
+from age_stats import AgeStats
+
+# user_id holds UUID strings; ranges are cut on this many leading hex digits
+PREFIX_DIGITS = 4
+
+
+def key_ranges(shards):
+    """
+    Split the user_id space into `shards` half-open (low, high) ranges.
+
+    Boundaries are evenly spaced hex prefixes, which balances random
+    (version 4) UUIDs. The first and last ranges are open-ended (None), so
+    every key falls in exactly one range whatever its format.
+    """
+    space = 16 ** PREFIX_DIGITS
+    bounds = [format(i * space // shards, f'0{PREFIX_DIGITS}x')
+              for i in range(1, shards)]
+    lows = [None] + bounds
+    highs = bounds + [None]
+    return list(zip(lows, highs))
+
+
+def range_spec(low, high, columns=None, where=()):
+    """QuerySpec selecting the rows with low <= user_id < high."""
+    predicates = list(where)
+    if low is not None:
+        predicates.append(('user_id', '>=', low))
+    if high is not None:
+        predicates.append(('user_id', '<', high))
+    return seed.QuerySpec(columns=columns, where=predicates)
+
+
+def scan_shard(task):
+    """
+    Worker body: stream one key range on a fresh connection and reduce it.
+    `task` is (low, high, columns, where, accumulate, chunk_size).
+    """
+    low, high, columns, where, accumulate, chunk_size = task
+    connection = seed.connect_to_prodev()
+    if connection is None:
+        raise mysql.connector.Error("scan worker could not connect")
+    try:
+        spec = range_spec(low, high, columns, where)
+        return accumulate(seed.stream_rows(connection, chunk_size=chunk_size,
+                                           spec=spec))
+    finally:
+        connection.close()
+
+
+def parallel_scan(accumulate, merge, columns=None, where=(), workers=None,
+                  shards=None, chunk_size=1000):
+    """
+    Scan user_data in parallel and return the merged result.
+
+    accumulate: function(rows) -> partial result for one key range; rows
+                are tuples in `columns` order
+    merge:      function(a, b) -> combined partial result
+    columns / where: pushed down through seed.QuerySpec
+    workers:    worker processes (default: os.cpu_count())
+    shards:     key ranges (default: 4 per worker, to even out skew)
+    """
+    workers = workers or os.cpu_count() or 1
+    shards = shards or workers * 4
+    tasks = [(low, high, columns, tuple(where), accumulate, chunk_size)
+             for low, high in key_ranges(shards)]
+    if workers == 1:
+        partials = map(scan_shard, tasks)
+        return reduce(merge, partials)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return reduce(merge, pool.map(scan_shard, tasks))
+
+
+def accumulate_ages(rows):
+    """AgeStats over (age,) rows."""
+    return AgeStats().update(int(age) for (age,) in rows)
+
+
+def merge_age_stats(a, b):
+    """Combine two AgeStats partials."""
+    return a.merge(b)
+
+
+def parallel_age_statistics(workers=None):
+    """
+    Parallel counterpart of 4-stream_ages.calculate_age_statistics:
+    returns an AgeStats over every user's age.
+    """
+    return parallel_scan(accumulate_ages, merge_age_stats, columns=('age',),
+                         workers=workers)
+
+
+def count_rows(rows):
+    """Number of rows in a shard."""
+    return sum(1 for _ in rows)
+
+
+def add(a, b):
+    """Sum two partial counts."""
+    return a + b
+
+
+def parallel_count_over_age(age=25, workers=None):
+    """
+    Parallel counterpart of 1-batch_processing.batch_processing's filter:
+    counts users older than `age`.
+    """
+    return parallel_scan(count_rows, add, columns=('user_id',),
+                         where=[('age', '>', age)], workers=workers)
+
+
+if __name__ == "__main__":
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    stats = parallel_age_statistics(workers)
+    print(f"Average age of users: {stats.mean:.2f}")
+    print(stats.summary())
@@ -0,0 +1,252 @@
+#!/usr/bin/python3
+"""
+Composable lazy pipelines over user_data streams.
+
+Usage:
+    from pipeline import Pipeline
+
+    adults = (Pipeline.from_table(conn, spec=QuerySpec(
+                  columns=('name', 'age'), where=[('age', '>', 25)]))
+              .map(lambda row: row[0])
+              .take(100)
+              .to_list())
+
+A pipeline is a source of row chunks (seed.stream_row_chunks) followed by
+stages:
+- map(fn) / filter(pred): stateless; adjacent ones are fused and applied
+  to a whole chunk with list(map(...)) / list(filter(...)), so there is no
+  generator hop per row.
+- batch(n): regroup rows into lists of n.
+- window(size, step=1): sliding tuples of `size` consecutive rows.
+- take(n): stop after n items and close the source. When only map and
+  parallel stages sit between from_table and take, n is pushed into the
+  query as its LIMIT. Otherwise (a filter, batch or window first) closing
+  the cursor early reads the rest of the result set off the wire so the
+  connection stays usable, which costs as much as reading it: move
+  filters into the QuerySpec where so the limit can be pushed down.
+- parallel(workers): run the stateless stages that follow it on a thread
+  pool, one task per chunk, keeping output order.
+
+Nothing runs until a sink pulls: iteration, to_list(), for_each(), reduce()
+or count().
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce as _reduce
+from itertools import islice
+
+import seed
+
+
+def _apply(segment, chunk):
+    """Run fused map/filter stages over one chunk."""
+    for kind, fn in segment:
+        if kind == 'map':
+            chunk = list(map(fn, chunk))
+        else:
+            chunk = list(filter(fn, chunk))
+    return chunk
+
+
+def _run_segment(chunks, segment):
+    for chunk in chunks:
+        chunk = _apply(segment, chunk)
+        if chunk:
+            yield chunk
+
+
+def _run_segment_parallel(chunks, segment, workers):
+    """Like _run_segment, with chunks processed on a thread pool in order."""
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append(executor.submit(_apply, segment, chunk))
+            if len(pending) >= workers * 2:
+                result = pending.popleft().result()
+                if result:
+                    yield result
+        while pending:
+            result = pending.popleft().result()
+            if result:
+                yield result
+    finally:
+        # Stopped early: drop the queued chunks instead of processing them
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def _batch(chunks, size):
+    buffer = []
+    for chunk in chunks:
+        buffer.extend(chunk)
+        full = len(buffer) - len(buffer) % size
+        if full:
+            yield [buffer[i:i + size] for i in range(0, full, size)]
+            buffer = buffer[full:]
+    if buffer:
+        yield [buffer]
+
+
+def _window(chunks, size, step):
+    buffer = []
+    start = 0
+    for chunk in chunks:
+        buffer.extend(chunk)
+        windows = []
+        while start + size <= len(buffer):
+            windows.append(tuple(buffer[start:start + size]))
+            start += step
+        drop = min(start, len(buffer))
+        buffer = buffer[drop:]
+        start -= drop
+        if windows:
+            yield windows
+
+
+def _take(chunks, limit):
+    remaining = limit
+    if remaining <= 0:
+        return
+    for chunk in chunks:
+        if len(chunk) >= remaining:
+            yield chunk[:remaining]
+            return
+        remaining -= len(chunk)
+        yield chunk
+
+
+_STATEFUL = {
+    'batch': _batch,
+    'window': _window,
+    'take': _take,
+}
+
+
+class Pipeline:
+    """Lazy, chunk-at-a-time pipeline; every stage returns a new Pipeline."""
+
+    def __init__(self, source, stages=(), limited_source=None):
+        self._source = source
+        self._stages = tuple(stages)
+        # limited_source(n): the same source returning at most n rows, for
+        # sources that can push take(n) down (from_table)
+        self._limited_source = limited_source
+
+    @classmethod
+    def from_table(cls, connection, table='user_data', chunk_size=1000,
+                   spec=None, adaptive=None):
+        """Pipeline over seed.stream_row_chunks(connection, ...)."""
+        def limited_source(limit):
+            limited = spec or seed.QuerySpec()
+            if limited.limit is None or limit < limited.limit:
+                limited = seed.QuerySpec(limited.columns, limited.where,
+                                         limited.order_by, limit)
+            return seed.stream_row_chunks(connection, table, chunk_size,
+                                          limited, adaptive)
+        return cls(lambda: seed.stream_row_chunks(connection, table, chunk_size,
+                                                  spec, adaptive),
+                   limited_source=limited_source)
+
+    @classmethod
+    def from_iterable(cls, iterable, chunk_size=1000):
+        """Pipeline over any iterable of rows, chunked `chunk_size` at a time."""
+        def chunks():
+            items = iter(iterable)
+            while True:
+                chunk = list(islice(items, chunk_size))
+                if not chunk:
+                    return
+                yield chunk
+        return cls(chunks)
+
+    def _then(self, kind, arg):
+        return Pipeline(self._source, self._stages + ((kind, arg),),
+                        self._limited_source)
+
+    def _open_source(self):
+        # A take() reached through 1:1 stages only bounds the rows the
+        # source has to produce
+        if self._limited_source is not None:
+            for kind, arg in self._stages:
+                if kind == 'take':
+                    return self._limited_source(max(arg[0], 0))
+                if kind not in ('map', 'parallel'):
+                    break
+        return self._source()
+
+    def map(self, fn):
+        return self._then('map', fn)
+
+    def filter(self, pred):
+        return self._then('filter', pred)
+
+    def batch(self, size):
+        return self._then('batch', (size,))
+
+    def window(self, size, step=1):
+        return self._then('window', (size, step))
+
+    def take(self, limit):
+        return self._then('take', (limit,))
+
+    def parallel(self, workers=4):
+        return self._then('parallel', workers)
+
+    def chunks(self):
+        """Generator over the output chunks (lists of items)."""
+        stream = self._open_source()
+        opened = [stream]
+        segment = []
+        workers = None
+
+        def flush(stream):
+            if not segment:
+                return stream
+            if workers:
+                return _run_segment_parallel(stream, list(segment), workers)
+            return _run_segment(stream, list(segment))
+
+        for kind, arg in self._stages:
+            if kind in ('map', 'filter'):
+                segment.append((kind, arg))
+                continue
+            stream = flush(stream)
+            opened.append(stream)
+            segment.clear()
+            workers = None
+            if kind == 'parallel':
+                workers = arg
+            else:
+                stream = _STATEFUL[kind](stream, *arg)
+                opened.append(stream)
+        stream = flush(stream)
+        opened.append(stream)
+        try:
+            yield from stream
+        finally:
+            # Close downstream first so e.g. take() also releases the cursor
+            for generator in reversed(opened):
+                close = getattr(generator, 'close', None)
+                if close is not None:
+                    close()
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            yield from chunk
+
+    def to_list(self):
+        return [item for chunk in self.chunks() for item in chunk]
+
+    def for_each(self, fn):
+        for chunk in self.chunks():
+            for item in chunk:
+                fn(item)
+
+    def reduce(self, fn, initial):
+        return _reduce(fn, self, initial)
+
+    def count(self):
+        return sum(len(chunk) for chunk in self.chunks())
@@ -9,14 +9,36 @@ Prototypes implemented:
 - create_database(connection)
 - connect_to_prodev()
 - create_table(connection)
-- insert_data(connection, data)  # data is CSV filename
-- stream_rows(connection, table='user_data', chunk_size=100) -> generator yielding rows one by one
+- insert_data(connection, data, incremental=False)  # data is CSV filename
+- read_csv_rows(csv_file_path) -> generator of cleaned row tuples read through mmap
+- stream_rows(connection, table='user_data', chunk_size=100, spec=None) -> generator yielding rows one by one
+- stream_row_chunks(...) -> the same rows, one fetchmany chunk (list) at a time
+- QuerySpec(columns, where, order_by, limit) -> column/predicate/ordering pushdown for the streaming generators
+- prefetch(iterable, depth=2) -> generator that reads ahead on a background thread
+- UserRow -> compact __slots__ row with attribute and key access
+- resumable_stream_rows(checkpoint_path, ...) -> stream_rows that checkpoints and survives dropped connections
+- AdaptiveFetchSize -> fetchmany size tuned at runtime toward a latency and byte budget
+- stream_changes(connection, watermark_path, ...) -> rows inserted or updated since the stored watermark
+- age_aggregate(connection) / verify_age_aggregate(connection) -> trigger-maintained age histogram
+- data_version(connection) -> trigger-maintained count of committed user_data changes
+- ConnectionPool / get_pool() / pooled_connection() -> shared ALX_prodev connections
 """
 
 import os
+import re
+import sys
 import csv
+import json
+import mmap
+import time
+import queue
+import hashlib
+import threading
+from collections import deque
+from contextlib import contextmanager
 import mysql.connector
 from mysql.connector import errorcode
+from age_stats import AgeStats
 
 def connect_db():
     """
@@ -41,11 +63,18 @@ def connect_db():
         print(f"Error connecting to MySQL server: {err}")
         return None
 
+def database_name():
+    """
+    Name of the project database: ALX_prodev unless MYSQL_DATABASE points
+    elsewhere (e.g. a scratch database for benchmarks).
+    """
+    return os.getenv('MYSQL_DATABASE', 'ALX_prodev')
+
 def create_database(connection):
     """
     Create database ALX_prodev if it does not exist.
     """
-    DB_NAME = 'ALX_prodev'
+    DB_NAME = database_name()
     try:
         cursor = connection.cursor()
         cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{DB_NAME}` DEFAULT CHARACTER SET 'utf8mb4'")
@@ -54,9 +83,11 @@ def create_database(connection):
         print(f"Failed creating database: {err}")
         raise
 
-def connect_to_prodev():
+def connect_to_prodev(**options):
     """
     Connect to the ALX_prodev database and return the connection.
+    Extra keyword arguments are passed through to mysql.connector.connect
+    (for example allow_local_infile=True).
     """
     host = os.getenv('MYSQL_HOST', '127.0.0.1')
     user = os.getenv('MYSQL_USER', 'root')
@@ -68,14 +99,220 @@ def connect_to_prodev():
             user=user,
             password=password,
             port=port,
-            database='ALX_prodev',
-            autocommit=False  # we'll commit explicitly
+            database=database_name(),
+            autocommit=False,  # we'll commit explicitly
+            **options
         )
         return conn
     except mysql.connector.Error as err:
         print(f"Error connecting to ALX_prodev: {err}")
         return None
 
+class ConnectionPool:
+    """
+    Bounded pool of ALX_prodev connections.
+
+    Connections are created lazily up to `max_size`. On checkout a
+    connection that has been idle is pinged and replaced if it is dead; on
+    checkin any open transaction is rolled back so the next user starts
+    from a clean snapshot. When every connection is checked out, acquire()
+    waits up to `timeout` seconds for one to be returned.
+    """
+
+    def __init__(self, max_size=5, timeout=30, connect=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._connect = connect or connect_to_prodev
+        self._idle = []  # LIFO: the most recently returned connection first
+        self._lock = threading.Lock()
+        # Notified whenever a connection is returned or a slot frees up
+        self._available = threading.Condition(self._lock)
+        self._size = 0
+        self.metrics = {
+            "created": 0,
+            "checkouts": 0,
+            "reused": 0,
+            "waits": 0,
+            "health_check_failures": 0,
+            "discarded": 0,
+        }
+
+    @property
+    def in_use(self):
+        """Number of connections currently checked out."""
+        return self._size - len(self._idle)
+
+    def stats(self):
+        """Return a snapshot of the pool metrics."""
+        snapshot = dict(self.metrics)
+        snapshot.update(size=self._size, idle=len(self._idle),
+                        in_use=self.in_use, max_size=self.max_size)
+        return snapshot
+
+    def _new_connection(self):
+        conn = None
+        try:
+            conn = self._connect()
+        finally:
+            if conn is None:
+                self._free_slot()
+        if conn is None:
+            raise mysql.connector.Error("could not open a pooled connection")
+        self.metrics["created"] += 1
+        return conn
+
+    def _healthy(self, conn):
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            self.metrics["health_check_failures"] += 1
+            return False
+
+    def acquire(self):
+        """Check a healthy connection out of the pool."""
+        self.metrics["checkouts"] += 1
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._available:
+                waited = False
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise mysql.connector.errors.PoolError(
+                            f"no connection available after {self.timeout}s"
+                        )
+                    if not waited:
+                        self.metrics["waits"] += 1
+                        waited = True
+                    self._available.wait(remaining)
+                conn = self._idle.pop() if self._idle else None
+                if conn is None:
+                    self._size += 1
+            if conn is None:
+                return self._new_connection()
+            if self._healthy(conn):
+                self.metrics["reused"] += 1
+                return conn
+            self._discard(conn)
+
+    def release(self, conn):
+        """
+        Return a connection to the pool, discarding it if it is broken or
+        still has an unread result (a stream abandoned unclosed): rollback()
+        would first read every remaining row of the result off the wire,
+        while closing the connection costs nothing.
+        """
+        if getattr(conn, 'unread_result', False):
+            self._discard(conn)
+            return
+        try:
+            conn.rollback()
+        except mysql.connector.Error:
+            self._discard(conn)
+            return
+        with self._available:
+            self._idle.append(conn)
+            self._available.notify()
+
+    def _free_slot(self):
+        # A waiter may now open a connection of its own
+        with self._available:
+            self._size -= 1
+            self._available.notify()
+
+    def _discard(self, conn):
+        self.metrics["discarded"] += 1
+        self._free_slot()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """Close every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """
+    Return the process-wide ALX_prodev connection pool, creating it on
+    first use. MYSQL_POOL_SIZE sets its size (default 5).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(max_size=int(os.getenv('MYSQL_POOL_SIZE', 5)))
+        return _pool
+
+@contextmanager
+def pooled_connection(pool=None):
+    """
+    Context manager that checks a connection out of the pool and returns
+    it when the block exits.
+
+    Usage:
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+    """
+    pool = pool or get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+ROW_HASH_SQL = (
+    "UNHEX(MD5(CONCAT_WS(CHAR(31 USING utf8mb4), name, email, age)))"
+)
+
+UPDATED_AT_DEFINITION = (
+    "TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) "
+    "ON UPDATE CURRENT_TIMESTAMP(6) INVISIBLE"
+)
+
+def ensure_column(connection, table, column, definition):
+    """
+    Add `column` to `table` when an existing table predates it.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            "SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s "
+            "AND COLUMN_NAME = %s",
+            (table, column)
+        )
+        (exists,) = cursor.fetchone()
+        if not exists:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    finally:
+        cursor.close()
+
+def ensure_index(connection, table, index, columns):
+    """
+    Add index `index` on `columns` to `table` when an existing table
+    predates it.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            "SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s "
+            "AND INDEX_NAME = %s",
+            (table, index)
+        )
+        (exists,) = cursor.fetchone()
+        if not exists:
+            cursor.execute(f"ALTER TABLE {table} ADD INDEX {index} ({columns})")
+    finally:
+        cursor.close()
+
 def create_table(connection):
     """
     Create user_data table with:
@@ -83,36 +320,261 @@ def create_table(connection):
       name VARCHAR NOT NULL
       email VARCHAR NOT NULL
       age DECIMAL NOT NULL
+      row_hash BINARY(16) INVISIBLE, generated MD5 of name/email/age used by
+        insert_data(incremental=True) to skip unchanged rows
+      updated_at TIMESTAMP(6) INVISIBLE, set on insert and on every update
+        that changes the row, read by stream_changes
+    and secondary indexes on email, on age (for pushed-down age filters) and
+    on (updated_at, user_id), plus the trigger-maintained user_age_histogram
+    (create_age_aggregate) and user_data_version (create_change_counter).
+    Invisible columns need MySQL 8.0.23 or later.
     """
-    create_table_sql = """
+    row_hash_definition = f"BINARY(16) AS ({ROW_HASH_SQL}) STORED INVISIBLE"
+    create_table_sql = f"""
     CREATE TABLE IF NOT EXISTS user_data (
         user_id CHAR(36) NOT NULL,
         name VARCHAR(255) NOT NULL,
         email VARCHAR(255) NOT NULL,
         age DECIMAL(5,0) NOT NULL,
+        row_hash {row_hash_definition},
+        updated_at {UPDATED_AT_DEFINITION},
         PRIMARY KEY (user_id),
-        INDEX idx_email (email)
+        INDEX idx_email (email),
+        INDEX idx_age (age),
+        INDEX idx_updated_at (updated_at, user_id)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
     """
     try:
         cursor = connection.cursor()
         cursor.execute(create_table_sql)
-        connection.commit()
         cursor.close()
+        ensure_column(connection, 'user_data', 'row_hash', row_hash_definition)
+        ensure_index(connection, 'user_data', 'idx_age', 'age')
+        ensure_column(connection, 'user_data', 'updated_at', UPDATED_AT_DEFINITION)
+        ensure_index(connection, 'user_data', 'idx_updated_at',
+                     'updated_at, user_id')
+        connection.commit()
+        create_age_aggregate(connection)
+        create_change_counter(connection)
         print("Table user_data created successfully")
     except mysql.connector.Error as err:
         print(f"Failed creating table: {err}")
         raise
 
-def insert_data(connection, csv_file_path):
+# The age histogram is split into slots by CRC32(user_id) so concurrent
+# writers spread their counter updates instead of queueing on one row per age.
+AGE_AGGREGATE_SLOTS = 16
+_AGE_SLOT = f"CRC32({{row}}.user_id) % {AGE_AGGREGATE_SLOTS}"
+_AGE_INCREMENT = (
+    "INSERT INTO user_age_histogram (age, slot, users) "
+    f"VALUES (NEW.age, {_AGE_SLOT.format(row='NEW')}, 1) "
+    "ON DUPLICATE KEY UPDATE users = users + 1"
+)
+_AGE_DECREMENT = (
+    "UPDATE user_age_histogram SET users = users - 1 "
+    f"WHERE age = OLD.age AND slot = {_AGE_SLOT.format(row='OLD')}"
+)
+AGE_TRIGGERS = {
+    'user_data_age_ai': f"AFTER INSERT ON user_data FOR EACH ROW {_AGE_INCREMENT}",
+    'user_data_age_au': (
+        "AFTER UPDATE ON user_data FOR EACH ROW "
+        "BEGIN "
+        "IF NEW.age <> OLD.age OR NEW.user_id <> OLD.user_id THEN "
+        f"{_AGE_DECREMENT}; {_AGE_INCREMENT}; "
+        "END IF; "
+        "END"
+    ),
+    'user_data_age_ad': f"AFTER DELETE ON user_data FOR EACH ROW {_AGE_DECREMENT}",
+}
+
+def create_age_aggregate(connection):
     """
-    Insert data from CSV into user_data table if user_id does not already exist.
-    CSV expected columns: user_id,name,email,age (header allowed).
+    Create user_age_histogram (users per age, split into slots) and the
+    user_data triggers that keep it current. The triggers run inside the
+    writing statement, so every insert, upsert, REPLACE and delete updates
+    the aggregate in the same transaction. A newly created histogram is
+    filled from the existing rows.
     """
-    if not os.path.exists(csv_file_path):
-        raise FileNotFoundError(f"CSV file not found: {csv_file_path}")
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            "SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'user_age_histogram'"
+        )
+        (exists,) = cursor.fetchone()
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_age_histogram (
+            age DECIMAL(5,0) NOT NULL,
+            slot TINYINT UNSIGNED NOT NULL,
+            users BIGINT NOT NULL,
+            PRIMARY KEY (age, slot)
+        ) ENGINE=InnoDB;
+        """)
+        cursor.execute(
+            "SELECT TRIGGER_NAME FROM INFORMATION_SCHEMA.TRIGGERS "
+            "WHERE TRIGGER_SCHEMA = DATABASE() AND EVENT_OBJECT_TABLE = 'user_data'"
+        )
+        existing = {name for (name,) in cursor.fetchall()}
+        for name, definition in AGE_TRIGGERS.items():
+            if name not in existing:
+                cursor.execute(f"CREATE TRIGGER {name} {definition}")
+    finally:
+        cursor.close()
+    if not exists:
+        rebuild_age_aggregate(connection)
+
+# Per-slot count of committed changes to user_data, bumped by triggers in the
+# writing transaction: unlike MAX(updated_at) its sum moves on every commit,
+# whatever order concurrent writers commit in. Same slots as the histogram.
+_CHANGE_COUNT = (
+    "INSERT INTO user_data_version (slot, changes) "
+    f"VALUES ({_AGE_SLOT}, 1) "
+    "ON DUPLICATE KEY UPDATE changes = changes + 1"
+)
+VERSION_TRIGGERS = {
+    'user_data_version_ai': (
+        "AFTER INSERT ON user_data FOR EACH ROW "
+        f"{_CHANGE_COUNT.format(row='NEW')}"
+    ),
+    'user_data_version_au': (
+        "AFTER UPDATE ON user_data FOR EACH ROW "
+        "BEGIN "
+        "IF NOT (NEW.user_id <=> OLD.user_id AND NEW.name <=> OLD.name "
+        "AND NEW.email <=> OLD.email AND NEW.age <=> OLD.age) THEN "
+        f"{_CHANGE_COUNT.format(row='NEW')}; "
+        "END IF; "
+        "END"
+    ),
+    'user_data_version_ad': (
+        "AFTER DELETE ON user_data FOR EACH ROW "
+        f"{_CHANGE_COUNT.format(row='OLD')}"
+    ),
+}
+
+def create_change_counter(connection):
+    """
+    Create user_data_version and the user_data triggers that bump it on
+    every insert, changing update and delete. data_version() reads it.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_data_version (
+            slot TINYINT UNSIGNED NOT NULL,
+            changes BIGINT UNSIGNED NOT NULL,
+            PRIMARY KEY (slot)
+        ) ENGINE=InnoDB;
+        """)
+        cursor.execute(
+            "SELECT TRIGGER_NAME FROM INFORMATION_SCHEMA.TRIGGERS "
+            "WHERE TRIGGER_SCHEMA = DATABASE() AND EVENT_OBJECT_TABLE = 'user_data'"
+        )
+        existing = {name for (name,) in cursor.fetchall()}
+        for name, definition in VERSION_TRIGGERS.items():
+            if name not in existing:
+                cursor.execute(f"CREATE TRIGGER {name} {definition}")
+    finally:
+        cursor.close()
+
+def data_version(connection):
+    """
+    Number of changes committed to user_data since the counter was
+    created; it grows with every commit that inserts, changes or deletes a
+    row (TRUNCATE bypasses triggers and leaves it unchanged).
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT COALESCE(SUM(changes), 0) FROM user_data_version")
+        (changes,) = cursor.fetchone()
+    finally:
+        cursor.close()
+    return int(changes)
+
+def rebuild_age_aggregate(connection):
+    """Recompute user_age_histogram from a full scan of user_data."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("DELETE FROM user_age_histogram")
+        cursor.execute(
+            "INSERT INTO user_age_histogram (age, slot, users) "
+            f"SELECT age, {_AGE_SLOT.format(row='user_data')}, COUNT(*) "
+            "FROM user_data GROUP BY 1, 2"
+        )
+        connection.commit()
+    except mysql.connector.Error:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def _age_histogram(connection, sql):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(sql)
+        return {int(age): int(users) for age, users in cursor.fetchall() if users}
+    finally:
+        cursor.close()
+
+def age_aggregate(connection):
+    """
+    Return an AgeStats (count, mean, variance, min/max, histogram,
+    percentiles) read from user_age_histogram. The cost depends on the
+    number of distinct ages, not on the number of users.
+    """
+    return AgeStats.from_histogram(_age_histogram(
+        connection,
+        "SELECT age, SUM(users) FROM user_age_histogram GROUP BY age"
+    ))
 
-    insert_sql = """
+def verify_age_aggregate(connection, repair=True):
+    """
+    Compare user_age_histogram with a full scan of user_data. Prints the
+    differing ages and, with repair=True, rebuilds the aggregate from the
+    scan. Returns True when the stored aggregate was correct.
+    """
+    stored = _age_histogram(
+        connection,
+        "SELECT age, SUM(users) FROM user_age_histogram GROUP BY age"
+    )
+    scanned = _age_histogram(
+        connection, "SELECT age, COUNT(*) FROM user_data GROUP BY age"
+    )
+    drift = {age: (stored.get(age, 0), scanned.get(age, 0))
+             for age in set(stored) | set(scanned)
+             if stored.get(age, 0) != scanned.get(age, 0)}
+    if not drift:
+        print(f"Age aggregate OK ({sum(scanned.values())} users)")
+        return True
+    for age, (have, want) in sorted(drift.items()):
+        print(f"age {age}: aggregate has {have}, table has {want}")
+    if repair:
+        rebuild_age_aggregate(connection)
+        print("Age aggregate rebuilt from user_data")
+    return False
+
+def delete_users(connection, user_ids):
+    """
+    Delete users by user_id and commit; the age triggers remove them from
+    user_age_histogram in the same transaction.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0
+    cursor = connection.cursor()
+    try:
+        placeholders = ', '.join(['%s'] * len(user_ids))
+        cursor.execute(f"DELETE FROM user_data WHERE user_id IN ({placeholders})",
+                       tuple(user_ids))
+        deleted = cursor.rowcount
+        connection.commit()
+        return deleted
+    except mysql.connector.Error:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+UPSERT_SQL = """
     INSERT INTO user_data (user_id, name, email, age)
     VALUES (%s, %s, %s, %s)
     ON DUPLICATE KEY UPDATE
@@ -120,78 +582,673 @@ def insert_data(connection, csv_file_path):
       email = VALUES(email),
       age = VALUES(age)
     """
+
+def clean_row(uid, name, email, age):
+    """
+    Trim and validate one CSV record.
+    Returns the (user_id, name, email, age) tuple to insert, or None when
+    a field is missing or age is not numeric.
+    """
+    uid = (uid or '').strip()
+    name = (name or '').strip()
+    email = (email or '').strip()
+    age = (age or '').strip()
+    if not uid or not name or not email or not age:
+        # Skip incomplete rows
+        return None
+    # Convert age to numeric value acceptable by DECIMAL(5,0)
+    try:
+        age_val = int(float(age))
+    except ValueError:
+        # skip rows with malformed age
+        return None
+    return (uid, name, email, age_val)
+
+CSV_ID_COLUMNS = ('user_id', 'id', 'uuid')
+# How much of the mapping is parsed before its pages are released again
+RELEASE_EVERY = 8 * 1024 * 1024
+
+def csv_columns(header_line):
+    """
+    Map user_id/name/email/age to their positions in a CSV header line
+    (bytes). Raises ValueError if a column is missing.
+    """
+    header = [h.strip() for h in next(csv.reader([header_line.decode('utf-8-sig')]))]
+    uid_col = next((c for c in CSV_ID_COLUMNS if c in header), None)
+    if uid_col is None or not {'name', 'email', 'age'} <= set(header):
+        raise ValueError(f"Unexpected CSV header: {header}")
+    return {
+        'user_id': header.index(uid_col),
+        'name': header.index('name'),
+        'email': header.index('email'),
+        'age': header.index('age'),
+    }
+
+def read_csv_rows(csv_file_path, start=None, end=None, columns=None):
+    """
+    Generator that memory-maps a user_data CSV and yields cleaned
+    (user_id, name, email, age) tuples ready for executemany, one record
+    at a time and without building a dict per row.
+
+    Unquoted lines are split directly; lines containing quotes go through
+    csv.reader. Pages that have been parsed are handed back to the kernel
+    every RELEASE_EVERY bytes, so resident memory stays flat on files
+    larger than RAM.
+
+    start/end restrict parsing to a byte range that begins and ends on
+    line boundaries (used by the bulk loader); `columns` must then be the
+    csv_columns() mapping of the file header.
+    """
+    with open(csv_file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, 'madvise'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            if columns is None:
+                columns = csv_columns(mm.readline())
+            if start is not None:
+                mm.seek(start)
+            end = len(mm) if end is None else end
+            uid_i = columns['user_id']
+            name_i = columns['name']
+            email_i = columns['email']
+            age_i = columns['age']
+            width = max(columns.values()) + 1
+            released = mm.tell() - mm.tell() % mmap.PAGESIZE
+
+            while mm.tell() < end:
+                line = mm.readline()
+                if b'"' in line:
+                    # Quoted record, possibly spanning several lines
+                    while line.count(b'"') % 2 and mm.tell() < end:
+                        line += mm.readline()
+                    fields = next(csv.reader(line.decode('utf-8').splitlines(True)), [])
+                else:
+                    fields = line.decode('utf-8').rstrip('\r\n').split(',')
+                if len(fields) >= width:
+                    cleaned = clean_row(fields[uid_i], fields[name_i],
+                                        fields[email_i], fields[age_i])
+                    if cleaned is not None:
+                        yield cleaned
+
+                if mm.tell() - released >= RELEASE_EVERY and hasattr(mm, 'madvise'):
+                    upto = mm.tell() - mm.tell() % mmap.PAGESIZE
+                    mm.madvise(mmap.MADV_DONTNEED, released, upto - released)
+                    released = upto
+
+def row_hash(name, email, age):
+    """
+    Client-side twin of the user_data.row_hash generated column.
+    """
+    content = "\x1f".join((name, email, str(age)))
+    return hashlib.md5(content.encode('utf-8')).digest()
+
+def _upsert_changed(cursor, rows, counts):
+    """
+    Upsert only the rows of a batch that are new or whose content differs
+    from what is stored, comparing against the stored row_hash.
+    Updates counts['inserted'/'updated'/'skipped'] in place.
+    """
+    by_id = {row[0]: row for row in rows}
+    counts['skipped'] += len(rows) - len(by_id)  # repeated ids in the batch
+    placeholders = ', '.join(['%s'] * len(by_id))
+    cursor.execute(
+        f"SELECT user_id, row_hash FROM user_data WHERE user_id IN ({placeholders})",
+        tuple(by_id)
+    )
+    stored = {uid: bytes(digest) for uid, digest in cursor.fetchall()}
+
+    changed = []
+    for uid, row in by_id.items():
+        digest = stored.get(uid)
+        if digest is None:
+            counts['inserted'] += 1
+        elif digest != row_hash(*row[1:]):
+            counts['updated'] += 1
+        else:
+            counts['skipped'] += 1
+            continue
+        changed.append(row)
+    if changed:
+        cursor.executemany(UPSERT_SQL, changed)
+
+def insert_data(connection, csv_file_path, incremental=False):
+    """
+    Insert data from CSV into user_data table if user_id does not already exist.
+    CSV expected columns: user_id,name,email,age (header allowed).
+
+    With incremental=True each batch is first compared with the stored
+    row_hash values and only new or changed rows are written, so a re-seed
+    of a mostly unchanged file leaves the table untouched. Returns
+    {"inserted", "updated", "skipped"} counts in that mode.
+    """
+    if not os.path.exists(csv_file_path):
+        raise FileNotFoundError(f"CSV file not found: {csv_file_path}")
+
     # We'll upsert (insert or update) to avoid duplicates; primary key is user_id.
     # If you prefer skip-on-duplicate, change to INSERT IGNORE.
 
+    counts = {'inserted': 0, 'updated': 0, 'skipped': 0}
+
+    def flush(rows):
+        if incremental:
+            _upsert_changed(cursor, rows, counts)
+        else:
+            cursor.executemany(UPSERT_SQL, rows)
+        connection.commit()
+
     try:
         cursor = connection.cursor()
-        with open(csv_file_path, newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            rows_to_insert = []
-            count = 0
-            for row in reader:
-                # Trim values and basic validations
-                uid = row.get('user_id') or row.get('id') or row.get('uuid')
-                name = row.get('name', '').strip()
-                email = row.get('email', '').strip()
-                age = row.get('age', '').strip()
-
-                if not uid or not name or not email or not age:
-                    # Skip incomplete rows
-                    continue
-                # Convert age to numeric value acceptable by DECIMAL(5,0)
-                try:
-                    age_val = int(float(age))
-                except ValueError:
-                    # skip rows with malformed age
-                    continue
-
-                rows_to_insert.append((uid.strip(), name, email, age_val))
-                # Bulk insert in batches to be efficient
-                if len(rows_to_insert) >= 200:
-                    cursor.executemany(insert_sql, rows_to_insert)
-                    connection.commit()
-                    count += len(rows_to_insert)
-                    rows_to_insert = []
-
-            if rows_to_insert:
-                cursor.executemany(insert_sql, rows_to_insert)
-                connection.commit()
+        rows_to_insert = []
+        count = 0
+        for cleaned in read_csv_rows(csv_file_path):
+            rows_to_insert.append(cleaned)
+            # Bulk insert in batches to be efficient
+            if len(rows_to_insert) >= 200:
+                flush(rows_to_insert)
                 count += len(rows_to_insert)
+                rows_to_insert = []
+
+        if rows_to_insert:
+            flush(rows_to_insert)
+            count += len(rows_to_insert)
 
         cursor.close()
+        if incremental:
+            print(f"Inserted {counts['inserted']}, updated {counts['updated']}, "
+                  f"skipped {counts['skipped']} unchanged rows from {csv_file_path}")
+            return counts
         print(f"Inserted/updated {count} rows from {csv_file_path}")
     except mysql.connector.Error as err:
         print(f"MySQL error during insert: {err}")
         connection.rollback()
         raise
 
-def stream_rows(connection, table='user_data', chunk_size=100):
+USER_COLUMNS = ('user_id', 'name', 'email', 'age')
+SQL_OPERATORS = ('=', '!=', '<', '<=', '>', '>=')
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def _identifier(name):
+    if not _IDENTIFIER.match(name):
+        raise ValueError(f"Invalid column name: {name!r}")
+    return name
+
+class QuerySpec:
+    """
+    Which columns, rows and order a streaming query should return, so the
+    work is done by MySQL instead of in Python.
+
+      columns:  column names to select (default user_id, name, email, age)
+      where:    (column, op, value) predicates ANDed together; op is one
+                of SQL_OPERATORS, values are sent as query parameters
+      order_by: column names, prefixed with '-' for descending order
+      limit:    maximum number of rows
+
+    Usage:
+        spec = QuerySpec(columns=('user_id', 'age'), where=[('age', '>', 25)])
+        sql, params = spec.to_sql('user_data')
+    """
+
+    def __init__(self, columns=None, where=(), order_by=(), limit=None):
+        self.columns = tuple(columns or USER_COLUMNS)
+        self.where = [tuple(predicate) for predicate in where]
+        self.order_by = tuple(order_by)
+        self.limit = limit
+        for column in self.columns:
+            _identifier(column)
+        for column, op, _ in self.where:
+            _identifier(column)
+            if op not in SQL_OPERATORS:
+                raise ValueError(f"Unsupported operator: {op!r}")
+        for column in self.order_by:
+            _identifier(column.lstrip('-'))
+
+    def to_sql(self, table='user_data', placeholder='%s'):
+        """Return (sql, params) for this spec against `table`."""
+        sql = f"SELECT {', '.join(self.columns)} FROM {_identifier(table)}"
+        params = []
+        if self.where:
+            sql += " WHERE " + " AND ".join(
+                f"{column} {op} {placeholder}" for column, op, _ in self.where
+            )
+            params.extend(value for _, _, value in self.where)
+        if self.order_by:
+            sql += " ORDER BY " + ", ".join(
+                f"{column[1:]} DESC" if column.startswith('-') else column
+                for column in self.order_by
+            )
+        if self.limit is not None:
+            sql += f" LIMIT {int(self.limit)}"
+        return sql, tuple(params)
+
+class UserRow:
+    """
+    Compact user_data row. Uses __slots__ instead of a per-row dict but
+    still reads like one: row.age, row['age'], row.get('age'), keys(),
+    items() and dict(row) all work. Columns missing from a projected
+    query are None.
+    """
+
+    __slots__ = USER_COLUMNS
+
+    def __init__(self, user_id=None, name=None, email=None, age=None):
+        self.user_id = user_id
+        self.name = name
+        self.email = email
+        self.age = age
+
+    @classmethod
+    def factory(cls, column_names):
+        """Return a function turning row tuples with these columns into UserRows."""
+        names = tuple(column_names)
+        unknown = set(names) - set(cls.__slots__)
+        if unknown:
+            raise ValueError(f"UserRow has no column(s): {sorted(unknown)}")
+        if names == cls.__slots__:
+            return lambda row: cls(*row)
+        return lambda row: cls(**dict(zip(names, row)))
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def keys(self):
+        return self.__slots__
+
+    def values(self):
+        return tuple(getattr(self, key) for key in self.__slots__)
+
+    def items(self):
+        return tuple((key, getattr(self, key)) for key in self.__slots__)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def __eq__(self, other):
+        if isinstance(other, (UserRow, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self):
+        fields = ", ".join(f"{key}={value!r}" for key, value in self.items())
+        return f"UserRow({fields})"
+
+_DONE = object()
+
+def prefetch(iterable, depth=2):
+    """
+    Generator that iterates `iterable` on a background thread and keeps up
+    to `depth` items queued, so producing item N+1 (e.g. a fetchmany round
+    trip) overlaps with the caller processing item N.
+
+    The bounded queue applies backpressure to the producer. Exceptions from
+    the producer are re-raised in the caller. Closing this generator early
+    stops the producer, closes `iterable` on its own thread and waits for
+    the thread to exit, so the caller can safely close the cursor after.
+    """
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    break
+            else:
+                put((_DONE, None))
+        except BaseException as err:
+            put((None, err))
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                try:
+                    close()
+                except Exception:
+                    pass
+
+    worker = threading.Thread(target=produce, name='prefetch', daemon=True)
+    worker.start()
+    try:
+        while True:
+            item, err = items.get()
+            if err is not None:
+                raise err
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        stop.set()
+        worker.join()
+
+def estimate_bytes(rows, sample=32):
+    """
+    Rough payload size of a batch of tuple or dict rows, extrapolated from
+    its first `sample` rows: string/bytes lengths plus 8 bytes per other value.
+    """
+    if not rows:
+        return 0
+    head = rows[:sample]
+    total = 0
+    for row in head:
+        for value in (row.values() if isinstance(row, dict) else row):
+            total += len(value) if isinstance(value, (str, bytes, bytearray)) else 8
+    return total * len(rows) // len(head)
+
+class AdaptiveFetchSize:
+    """
+    Picks the fetchmany size at runtime. After every batch it estimates the
+    time and bytes per row and moves the size toward the largest batch that
+    fits both `target_latency` seconds and `target_bytes`, changing it by
+    at most 2x per batch and keeping it within [min_size, max_size].
+
+    Monitoring: `size` is the current choice and `history` holds the last
+    `history_size` batches as dicts of size, rows, seconds and bytes;
+    stats() summarizes them.
+    """
+
+    def __init__(self, initial=100, target_latency=0.05,
+                 target_bytes=1024 * 1024, min_size=10, max_size=50000,
+                 history_size=100):
+        self.size = initial
+        self.target_latency = target_latency
+        self.target_bytes = target_bytes
+        self.min_size = min_size
+        self.max_size = max_size
+        self.history = deque(maxlen=history_size)
+        self.batches = 0
+
+    def observe(self, rows, seconds, nbytes):
+        """Record one batch and adjust the size for the next one."""
+        self.batches += 1
+        self.history.append({"size": self.size, "rows": rows,
+                             "seconds": seconds, "bytes": nbytes})
+        if rows == 0:
+            return self.size
+        ideal = self.target_bytes / max(nbytes / rows, 1)
+        if seconds > 0:
+            ideal = min(ideal, self.target_latency / (seconds / rows))
+        # A short final batch says nothing about larger ones; don't grow on it
+        upper = self.size * 2 if rows >= self.size else self.size
+        ideal = max(self.size / 2, min(ideal, upper))
+        self.size = int(max(self.min_size, min(self.max_size, ideal)))
+        return self.size
+
+    def fetch(self, cursor):
+        """fetchmany() with the current size, timed and fed to observe()."""
+        start = time.perf_counter()
+        rows = cursor.fetchmany(self.size)
+        self.observe(len(rows), time.perf_counter() - start, estimate_bytes(rows))
+        return rows
+
+    def stats(self):
+        """Current size plus averages over the recorded batches."""
+        recent = list(self.history)
+        count = len(recent) or 1
+        return {
+            "size": self.size,
+            "batches": self.batches,
+            "avg_rows": sum(b["rows"] for b in recent) / count,
+            "avg_seconds": sum(b["seconds"] for b in recent) / count,
+            "avg_bytes": sum(b["bytes"] for b in recent) / count,
+            "max_seconds": max((b["seconds"] for b in recent), default=0.0),
+        }
+
+def stream_row_chunks(connection, table='user_data', chunk_size=100, spec=None,
+                      adaptive=None):
+    """
+    Generator that streams rows from the given table a fetchmany chunk
+    (list of rows) at a time. Takes the same arguments as stream_rows.
+    Closing it before the end reads the rest of the result set off the
+    wire (see _close_streaming_cursor); bound early-stopping reads with
+    QuerySpec(limit=...).
+    """
+    sql, params = (spec or QuerySpec()).to_sql(table)
+    cursor = connection.cursor(buffered=False)  # unbuffered cursor for streaming behaviour
+    try:
+        cursor.execute(sql, params)
+        while True:
+            if adaptive is not None:
+                rows = adaptive.fetch(cursor)
+            else:
+                rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        _close_streaming_cursor(connection, cursor)
+
+def _close_streaming_cursor(connection, cursor):
+    """
+    Close an unbuffered cursor, first reading off whatever is left of its
+    result set when the consumer stopped early (take(), break, an error).
+    Without that the cursor cannot close and the connection's next query
+    fails with "Unread result found". The rest of the rows still cross the
+    wire, so bound early-stopping scans with QuerySpec(limit=...).
+    """
+    try:
+        if getattr(connection, 'unread_result', False):
+            connection.consume_results()
+        cursor.close()
+    except mysql.connector.Error as err:
+        # Typically the connection itself failed, which the caller sees
+        print(f"Error closing streaming cursor: {err}")
+
+def stream_rows(connection, table='user_data', chunk_size=100, spec=None,
+                adaptive=None):
     """
     Generator that streams rows from the given table one by one.
     Yields tuples (user_id, name, email, age) or dictionaries if dictionary cursor is used.
+    A QuerySpec narrows the columns, rows and order that are fetched.
+    An AdaptiveFetchSize replaces the fixed chunk_size with a size tuned
+    from the observed per-chunk latency and size.
 
     Usage:
         for row in stream_rows(conn):
             process(row)
     """
-    cursor = connection.cursor(buffered=False)  # unbuffered cursor for streaming behaviour
+    chunks = stream_row_chunks(connection, table, chunk_size, spec, adaptive)
     try:
-        cursor.execute(f"SELECT user_id, name, email, age FROM {table}")
+        for rows in chunks:
+            for r in rows:
+                yield r
+    finally:
+        chunks.close()
+
+TRANSIENT_ERRORS = (
+    mysql.connector.errors.OperationalError,
+    mysql.connector.errors.InterfaceError,
+)
+
+def read_checkpoint(checkpoint_path):
+    """Return the last key recorded in a checkpoint file, or None."""
+    try:
+        with open(checkpoint_path, encoding='utf-8') as f:
+            return json.load(f).get('last_key')
+    except FileNotFoundError:
+        return None
+
+def write_checkpoint(checkpoint_path, last_key):
+    """Atomically record `last_key` in a checkpoint file."""
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'last_key': last_key}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, checkpoint_path)
+
+def resumable_stream_rows(checkpoint_path, table='user_data', chunk_size=100,
+                          checkpoint_every=1000, max_retries=5, retry_delay=1.0,
+                          connect=connect_to_prodev):
+    """
+    Generator like stream_rows that walks the table in primary key order
+    and can pick up where it left off.
+
+    - Rows are read with WHERE user_id > <last emitted key> ORDER BY user_id,
+      so a scan can restart from any key.
+    - A row counts as done once the caller asks for the next one; every
+      `checkpoint_every` done rows (and when the generator is closed or
+      finishes) the last done key is written to `checkpoint_path`.
+    - On a dropped connection (TRANSIENT_ERRORS) it reconnects with
+      `connect` after `retry_delay` seconds and continues after the last
+      emitted key, giving up after `max_retries` consecutive failures.
+    - A new call with an existing checkpoint file resumes after it; delete
+      the file to scan from the beginning again.
+
+    Within one run every row is yielded exactly once. After a crash, rows
+    done since the last checkpoint are yielded again, so use
+    checkpoint_every=1 when the caller cannot tolerate any replay.
+
+    Yields tuples (user_id, name, email, age).
+    """
+    last_key = read_checkpoint(checkpoint_path)
+    saved_key = last_key
+    done = 0
+    failures = 0
+    try:
+        while True:
+            connection = None
+            cursor = None
+            try:
+                connection = connect()
+                if connection is None:
+                    raise mysql.connector.errors.InterfaceError("could not connect")
+                where = [] if last_key is None else [('user_id', '>', last_key)]
+                spec = QuerySpec(where=where, order_by=['user_id'])
+                sql, params = spec.to_sql(table)
+                cursor = connection.cursor(buffered=False)
+                cursor.execute(sql, params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        return
+                    failures = 0
+                    for row in rows:
+                        yield row
+                        last_key = row[0]
+                        done += 1
+                        if done % checkpoint_every == 0:
+                            write_checkpoint(checkpoint_path, last_key)
+                            saved_key = last_key
+            except TRANSIENT_ERRORS as err:
+                failures += 1
+                if failures > max_retries:
+                    raise
+                print(f"Scan interrupted after key {last_key!r} ({err}); "
+                      f"reconnecting in {retry_delay}s")
+                time.sleep(retry_delay)
+            finally:
+                for resource in (cursor, connection):
+                    if resource is not None:
+                        try:
+                            resource.close()
+                        except Exception:
+                            pass
+    finally:
+        if last_key != saved_key:
+            write_checkpoint(checkpoint_path, last_key)
+
+# Newest updated_at stream_changes may hand out: nothing a transaction that
+# is still open could have stamped (its own connection's aside)
+CHANGES_CUTOFF = (
+    "SELECT LEAST(NOW(6), COALESCE(MIN(trx_started), NOW(6))) "
+    "- INTERVAL %s MICROSECOND "
+    "FROM information_schema.INNODB_TRX "
+    "WHERE trx_mysql_thread_id <> CONNECTION_ID()"
+)
+
+def stream_changes(connection, watermark_path, table='user_data',
+                   chunk_size=100, lag=1.0, checkpoint_every=1000):
+    """
+    Generator over the rows inserted or updated since the watermark stored
+    in `watermark_path`, oldest change first.
+
+    - The watermark is the (updated_at, user_id) of the last change handed
+      out, kept with write_checkpoint; the first call (no file) yields every
+      row, later calls only what changed since.
+    - Rows are read in (updated_at, user_id) order over idx_updated_at, so
+      each call costs the number of changes, not the size of the table.
+    - A transaction stamps updated_at when each statement starts but its
+      rows only become visible when it commits, so the watermark must not
+      move past the start of any transaction still open: one LOAD DATA
+      stamps the whole file with its start time, and UpsertWriters commits
+      every commit_size rows. Only changes older than both NOW(6) and the
+      start of the oldest open InnoDB transaction (INNODB_TRX, which needs
+      the PROCESS privilege), minus `lag` seconds, are read. A long open
+      transaction therefore delays changes but never drops them; the lag
+      covers the gap between a statement starting and InnoDB registering
+      its transaction.
+    - The watermark is saved every `checkpoint_every` done rows and when the
+      generator is closed or finishes, as in resumable_stream_rows.
+
+    Deletes leave no row behind and are not reported.
+
+    The connection's current transaction is committed first so the scan
+    reads a fresh snapshot rather than one left open by an earlier query.
+
+    Yields tuples (user_id, name, email, age, updated_at).
+    """
+    watermark = read_checkpoint(watermark_path)
+    saved = watermark
+    done = 0
+    connection.commit()
+    cursor = connection.cursor(buffered=False)
+    try:
+        cursor.execute(CHANGES_CUTOFF, (int(lag * 1000000),))
+        (cutoff,) = cursor.fetchall()[0]
+        sql = ("SELECT user_id, name, email, age, updated_at "
+               f"FROM {_identifier(table)} WHERE updated_at <= %s")
+        params = [cutoff]
+        if watermark is not None:
+            changed_at, user_id = watermark
+            sql += " AND (updated_at > %s OR (updated_at = %s AND user_id > %s))"
+            params += [changed_at, changed_at, user_id]
+        sql += " ORDER BY updated_at, user_id"
+        cursor.execute(sql, params)
         while True:
             rows = cursor.fetchmany(chunk_size)
             if not rows:
                 break
-            for r in rows:
-                yield r
+            for row in rows:
+                yield row
+                watermark = [str(row[4]), row[0]]
+                done += 1
+                if done % checkpoint_every == 0:
+                    write_checkpoint(watermark_path, watermark)
+                    saved = watermark
     finally:
-        try:
-            cursor.close()
-        except Exception:
-            pass
+        _close_streaming_cursor(connection, cursor)
+        if watermark != saved:
+            write_checkpoint(watermark_path, watermark)
 
 # --- If run as script, allow quick end-to-end seeding ---
-if __name__ == "__main__":
+# ./seed.py verify-age-aggregate checks (and repairs) user_age_histogram
+if __name__ == "__main__" and sys.argv[1:] == ['verify-age-aggregate']:
+    conn = connect_to_prodev()
+    if conn:
+        ok = verify_age_aggregate(conn)
+        conn.close()
+        sys.exit(0 if ok else 1)
+elif __name__ == "__main__":
     # basic demo flow that mirrors the 0-main behavior you showed
     conn = connect_db()
     if conn:
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Unit tests for pipeline limit pushdown"""
+
+import unittest
+
+import seed
+from pipeline import Pipeline
+from test_seed import FakeStreamingConnection
+
+
+def users(count):
+    return [(i, 'name', 'email', 20 + i) for i in range(count)]
+
+
+class TestTakePushdown(unittest.TestCase):
+    """take(n) becomes the query's LIMIT when nothing before it drops rows"""
+
+    def test_take_after_map_limits_query(self):
+        """map and parallel keep one output per row, so n rows suffice"""
+        conn = FakeStreamingConnection(users(10))
+        names = (Pipeline.from_table(conn, chunk_size=4)
+                 .map(lambda row: row[0])
+                 .parallel(2)
+                 .map(str)
+                 .take(3)
+                 .to_list())
+        self.assertEqual(names, ['0', '1', '2'])
+        self.assertTrue(conn.executed[0].endswith(" LIMIT 3"))
+
+    def test_take_keeps_smaller_spec_limit(self):
+        """A tighter limit already in the spec wins"""
+        conn = FakeStreamingConnection(users(2))
+        spec = seed.QuerySpec(columns=('user_id',), limit=2)
+        Pipeline.from_table(conn, spec=spec).take(5).to_list()
+        self.assertTrue(conn.executed[0].endswith(" LIMIT 2"))
+
+    def test_take_after_filter_is_not_pushed_down(self):
+        """A filter may drop rows, so the query stays unbounded"""
+        conn = FakeStreamingConnection(users(10))
+        ages = (Pipeline.from_table(conn, chunk_size=4)
+                .filter(lambda row: row[3] % 2)
+                .take(2)
+                .to_list())
+        self.assertEqual([row[3] for row in ages], [21, 23])
+        self.assertNotIn("LIMIT", conn.executed[0])
+        self.assertFalse(conn.unread_result)
+
+
+if __name__ == "__main__":
+    unittest.main()
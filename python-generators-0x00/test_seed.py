@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""Unit tests for the seed connection pool and streaming generators"""
+
+import os
+import time
+import uuid
+import tempfile
+import threading
+import unittest
+
+import seed
+
+
+class FakeConnection:
+    """Records what the pool does with a connection"""
+
+    def __init__(self, unread_result=False):
+        self.unread_result = unread_result
+        self.rolled_back = False
+        self.closed = False
+
+    def ping(self, reconnect=False):
+        pass
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        self.closed = True
+
+
+class FakeStreamingConnection:
+    """Serves rows through an unbuffered cursor that can't close mid-result"""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.unread_result = False
+        self.cursors = []
+        self.executed = []
+
+    def cursor(self, buffered=True):
+        cursor = FakeStreamingCursor(self)
+        self.cursors.append(cursor)
+        return cursor
+
+    def consume_results(self):
+        self.rows = []
+        self.unread_result = False
+
+
+class FakeStreamingCursor:
+    """Unbuffered cursor over the rows of a FakeStreamingConnection"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.closed = False
+
+    def execute(self, sql, params=()):
+        self.connection.executed.append(sql)
+        self.connection.unread_result = bool(self.connection.rows)
+
+    def fetchmany(self, size):
+        rows = self.connection.rows[:size]
+        del self.connection.rows[:size]
+        self.connection.unread_result = bool(self.connection.rows)
+        return rows
+
+    def close(self):
+        if self.connection.unread_result:
+            raise seed.mysql.connector.errors.InternalError("Unread result found")
+        self.closed = True
+
+
+class TestStreamRowChunks(unittest.TestCase):
+    """Tests for stream_row_chunks cleanup"""
+
+    def test_early_close_drains_and_closes_cursor(self):
+        """Stopping after the first chunk leaves the connection usable"""
+        conn = FakeStreamingConnection((i, 'name', 'email', 30) for i in range(10))
+        chunks = seed.stream_row_chunks(conn, chunk_size=3)
+        self.assertEqual(len(next(chunks)), 3)
+        chunks.close()
+        self.assertFalse(conn.unread_result)
+        self.assertTrue(conn.cursors[0].closed)
+
+    def test_full_read_closes_cursor(self):
+        """A stream read to the end just closes its cursor"""
+        conn = FakeStreamingConnection((i, 'name', 'email', 30) for i in range(5))
+        self.assertEqual(sum(map(len, seed.stream_row_chunks(conn, chunk_size=2))), 5)
+        self.assertTrue(conn.cursors[0].closed)
+
+
+class TestConnectionPoolRelease(unittest.TestCase):
+    """Tests for ConnectionPool.release"""
+
+    def setUp(self):
+        self.connections = []
+
+        def connect():
+            conn = FakeConnection()
+            self.connections.append(conn)
+            return conn
+        self.pool = seed.ConnectionPool(max_size=2, connect=connect)
+
+    def test_clean_connection_is_rolled_back_and_reused(self):
+        """A connection without pending rows goes back to the pool"""
+        conn = self.pool.acquire()
+        self.pool.release(conn)
+        self.assertTrue(conn.rolled_back)
+        self.assertFalse(conn.closed)
+        self.assertIs(self.pool.acquire(), conn)
+
+    def test_unread_result_is_discarded_without_rollback(self):
+        """An abandoned stream closes the connection instead of draining it"""
+        conn = self.pool.acquire()
+        conn.unread_result = True
+        self.pool.release(conn)
+        self.assertFalse(conn.rolled_back)
+        self.assertTrue(conn.closed)
+        self.assertEqual(self.pool.stats()["discarded"], 1)
+        self.assertEqual(self.pool.stats()["size"], 0)
+        self.assertIsNot(self.pool.acquire(), conn)
+
+    def test_discard_wakes_waiting_acquire(self):
+        """A waiter opens a new connection as soon as a slot is discarded"""
+        pool = seed.ConnectionPool(max_size=1, timeout=5,
+                                   connect=lambda: FakeConnection())
+        conn = pool.acquire()
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+        waiter.start()
+        time.sleep(0.1)
+        conn.unread_result = True
+        started = time.monotonic()
+        pool.release(conn)
+        waiter.join(5)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(len(acquired), 1)
+        self.assertIsNot(acquired[0], conn)
+        self.assertEqual(pool.stats()["waits"], 1)
+
+    def test_waiter_times_out_when_pool_stays_full(self):
+        """acquire() gives up after timeout seconds"""
+        pool = seed.ConnectionPool(max_size=1, timeout=0.1,
+                                   connect=lambda: FakeConnection())
+        pool.acquire()
+        with self.assertRaises(seed.mysql.connector.errors.PoolError):
+            pool.acquire()
+
+
+class TestStreamChangesOpenTransaction(unittest.TestCase):
+    """stream_changes against a server while another load is still open"""
+
+    def setUp(self):
+        previous = os.environ.get('MYSQL_DATABASE')
+        os.environ['MYSQL_DATABASE'] = os.getenv('BENCH_DATABASE', 'ALX_prodev_bench')
+        self.addCleanup(self.restore_database, previous)
+        server = seed.connect_db()
+        if server is None:
+            self.skipTest("no MySQL server")
+        seed.create_database(server)
+        server.close()
+        self.reader = self.connect()
+        seed.create_table(self.reader)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.watermark = os.path.join(tmp.name, 'changes.json')
+        self.ids = []
+        self.addCleanup(self.delete_rows)
+        cursor = self.reader.cursor()
+        cursor.execute("SELECT NOW(6)")
+        (now,) = cursor.fetchall()[0]
+        cursor.close()
+        seed.write_checkpoint(self.watermark, [str(now), ''])
+
+    @staticmethod
+    def restore_database(previous):
+        if previous is None:
+            os.environ.pop('MYSQL_DATABASE', None)
+        else:
+            os.environ['MYSQL_DATABASE'] = previous
+
+    def connect(self):
+        conn = seed.connect_to_prodev()
+        self.addCleanup(conn.close)
+        return conn
+
+    def insert(self, conn):
+        user_id = str(uuid.uuid4())
+        self.ids.append(user_id)
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO user_data (user_id, name, email, age) "
+                       "VALUES (%s, 'Change Test', 'change@example.com', 30)",
+                       (user_id,))
+        cursor.close()
+        return user_id
+
+    def delete_rows(self):
+        conn = self.connect()
+        cursor = conn.cursor()
+        for user_id in self.ids:
+            cursor.execute("DELETE FROM user_data WHERE user_id = %s", (user_id,))
+        conn.commit()
+        cursor.close()
+
+    def changes(self):
+        return [row[0] for row in
+                seed.stream_changes(self.reader, self.watermark, lag=0.05)]
+
+    def test_rows_of_open_load_are_not_skipped(self):
+        """A row committed after a later one is still reported"""
+        loader, other = self.connect(), self.connect()
+        slow = self.insert(loader)  # stays uncommitted for now
+        time.sleep(0.2)
+        fast = self.insert(other)
+        other.commit()
+        time.sleep(0.2)
+        self.assertNotIn(fast, self.changes())
+        loader.commit()
+        time.sleep(0.1)
+        self.assertEqual([i for i in self.changes() if i in self.ids], [slow, fast])
+
+
+if __name__ == "__main__":
+    unittest.main()